@@ -6,84 +6,265 @@ Logs inventory needs (e.g., "Low Milk", "Beans") to a Google Sheet.
 Uses items.json DB: new items via "Low" or confirmation; multi-mode accepts existing only.
 """
 
+import asyncio
+import logging
 import os
 import re
-from typing import Dict, List, Optional, Tuple
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl
 
 from dotenv import load_dotenv
 from pathlib import Path
 
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import BackgroundTasks, FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
 from twilio.request_validator import RequestValidator
 
-from services.i18n import get_supported_langs, get_user_lang, set_user_lang, t
+from services.i18n import DEFAULT_LANG, get_supported_langs, get_user_lang, set_user_lang, t
 from services.items_db import (
     add_item,
+    add_items,
+    batch_update,
     delete_item,
     get_all_items,
+    get_item,
     get_item_canonical_name,
-    get_item_supplier_id,
     get_items_by_supplier,
-    get_item_type,
     get_valid_prep_supplier_id,
     is_known_item,
     rename_item,
     set_prep_items_supplier,
+    set_required_quantities,
     set_required_quantity,
     update_item_supplier,
     update_item_type,
 )
-from services.sheets import append_inventory_row, append_inventory_rows
+from services.sheets import (
+    append_inventory_row,
+    append_inventory_rows,
+    append_prepared_rows,
+    build_inventory_row,
+)
 from services.suppliers_db import add_supplier, get_all, get_by_id, get_numbered_list
 
 load_dotenv()
 
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
 STATIC_DIR = Path(__file__).parent / "static"
 
-# Multi-item mode: key = sender_phone, value = list of (item, quantity) tuples
-_multi_mode_sessions: Dict[str, List[Tuple[str, int]]] = {}
+# Fallback values shared by the parser, webhook and Sheets rows
+UNKNOWN_ITEM = "Unknown Item"
+UNKNOWN_SENDER = "Unknown"
+LOW_STOCK = "Low Stock"
+
+# Twilio signature validator, built once (None = validation disabled, e.g. local dev)
+_TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
+_twilio_validator: Optional[RequestValidator] = (
+    RequestValidator(_TWILIO_AUTH_TOKEN) if _TWILIO_AUTH_TOKEN else None
+)
+# Public webhook URL exactly as configured in Twilio (what the signature is computed over).
+# Unset = use the request URL.
+_TWILIO_WEBHOOK_URL = os.environ.get("TWILIO_WEBHOOK_URL")
+
+class PendingKind(IntEnum):
+    """What a sender's pending message is expected to answer. Values index _PENDING_HANDLERS."""
+
+    NEW_ITEM = 0  # (item_name, quantity): reply yes/no to add a new item
+    SUPPLIER_SELECTION = 1  # (item_name, quantity): supplier number for a new Raw item
+    TYPE_SELECTION = 2  # (item_name, quantity, supplier_id): 1=Raw, 2=Prep for a new item
+    ADD_SUPPLIER = 3  # SupplierDraft: company, contact name, contact number
+    SUPPLIER_DETAILS = 4  # True: user sent Sup, awaiting number to show details
+    PREFERENCES = 5  # "menu" | "lang" | "prep_supplier"
+    EDIT = 6  # EditState: menu -> supplier/type/rename/delete
+    LOWS_FILL = 7  # FillState: collected = [(name, qty)]
+    NEED_FILL = 8  # FillState: collected = [(name, req_qty)]
+    MULTI = 9  # [(item, quantity), ...]: multi-item mode (Lows / S), "!" to finish
+
+
+class _ExpiringDict:
+    """
+    Minimal dict (get / [k]=v / pop / clear / in / len) whose entries expire ttl seconds after they
+    were last set or read, holding at most maxsize keys (least recently used dropped first).
+    """
+
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+
+    def _prune(self, now: float) -> None:
+        # Oldest-touched entries are at the front
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                break
+            del self._data[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        now = time.monotonic()
+        if entry[0] <= now:
+            del self._data[key]
+            return default
+        self._data[key] = (now + self.ttl, entry[1])
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        now = time.monotonic()
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        self._prune(now)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        self._prune(time.monotonic())
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
 
-# Pending new-item confirmation: key = sender_phone, value = (item_name, quantity)
-_pending_new_item: Dict[str, Tuple[str, int]] = {}
 
-# Pending supplier selection: key = sender_phone, value = (item_name, quantity)
-_pending_supplier_selection: Dict[str, Tuple[str, int]] = {}
+class SupplierDraft:
+    """Supa flow payload: step 1 = company, 2 = contact name, 3 = contact number."""
 
-# Pending add supplier: key = sender_phone, value = step number (1=company, 2=contact, 3=number)
-_pending_add_supplier: Dict[str, dict] = {}
+    __slots__ = ("step", "company_name", "contact_name")
 
-# Pending type selection: key = sender_phone, value = (item_name, quantity, supplier_id)
-_pending_type_selection: Dict[str, Tuple[str, int, Optional[str]]] = {}
+    def __init__(self) -> None:
+        self.step = 1
+        self.company_name = ""
+        self.contact_name = ""
 
-# Pending language selection: key = sender_phone (user sent "Lang", awaiting 1/2)
-_pending_lang_selection: Dict[str, bool] = {}
 
-# Pending supplier details: key = sender_phone (user sent "Sup", awaiting number to show details)
-_pending_supplier_details: Dict[str, bool] = {}
+class EditState:
+    """Edit flow payload: step is menu/supplier/type/type_raw_supplier/rename/delete_confirm."""
 
-# Pending preferences: key = sender_phone, value = "menu" | "lang" | "prep_supplier"
-_pending_preferences: Dict[str, str] = {}
+    __slots__ = ("step", "item_name", "type_raw_suppliers")
 
-# Pending edit: key = sender_phone, value = {"step": str, "item_name": str, ...}
-_pending_edit: Dict[str, dict] = {}
+    def __init__(self, step: str, item_name: str) -> None:
+        self.step = step
+        self.item_name = item_name
+        self.type_raw_suppliers: List[Tuple[int, dict]] = []
 
-# Pending Lows fill (פם <supplier_regex>): key = sender_phone, value = {"items": [...], "index": int, "collected": [(name,qty)]}
-_pending_lows_fill: Dict[str, dict] = {}
 
-# Pending Need fill (Need <supplier_regex>): key = sender_phone, value = {"items": [...], "index": int, "collected": [(name,req_qty)]}
-_pending_need_fill: Dict[str, dict] = {}
+class FillState:
+    """Lows/Need fill payload: items to walk, current position, and (name, quantity) answers so far."""
+
+    __slots__ = ("items", "index", "collected")
+
+    def __init__(self, items: List[dict]) -> None:
+        self.items = items
+        self.index = 0
+        self.collected: List[Tuple[str, int]] = []
+
+
+# Abandoned flows are dropped after this long without a message from the sender
+PENDING_TTL = 30 * 60  # seconds
+PENDING_MAX_SENDERS = 10_000
+
+# Pending state per sender (one flow at a time): key = sender_phone, value = (kind, payload)
+_pending = _ExpiringDict(ttl=PENDING_TTL, maxsize=PENDING_MAX_SENDERS)
+
+# Back / B / Exit / Quit / Cancel (matched case-insensitively on the stripped body)
+_BACK_COMMANDS = frozenset({"back", "b", "exit", "quit", "cancel"})
+# Yes/no confirmations, English and Hebrew (matched on the lowercased body)
+_YES_WORDS = frozenset({"yes", "y", "ye", "כן", "כ"})
+_NO_WORDS = frozenset({"no", "n", "לא", "ל"})
+
+# Single-item sheet rows are queued and flushed in batches (one append_rows call per batch)
+SHEETS_BATCH_SIZE = 20
+SHEETS_BATCH_WINDOW = 0.5  # seconds to wait for more rows after the first one
+
+# Set while the app is running (lifespan); None = append directly via BackgroundTasks
+_sheets_queue: Optional["asyncio.Queue[list]"] = None
+
+
+async def _sheets_writer(queue: "asyncio.Queue[list]") -> None:
+    """Drain queued rows: collect up to SHEETS_BATCH_SIZE or SHEETS_BATCH_WINDOW, then append in one call."""
+    loop = asyncio.get_running_loop()
+    while True:
+        rows = [await queue.get()]
+        deadline = loop.time() + SHEETS_BATCH_WINDOW
+        while len(rows) < SHEETS_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await run_in_threadpool(append_prepared_rows, rows)
+        except Exception:
+            logger.exception("Sheets batch append failed (%d rows)", len(rows))
+        finally:
+            for _ in rows:
+                queue.task_done()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Run the batched Sheets writer for the app's lifetime; flush pending rows on shutdown."""
+    global _sheets_queue
+    queue: "asyncio.Queue[list]" = asyncio.Queue()
+    writer = asyncio.create_task(_sheets_writer(queue))
+    _sheets_queue = queue
+    try:
+        yield
+    finally:
+        _sheets_queue = None
+        await queue.join()
+        writer.cancel()
+
 
 app = FastAPI(
     title="Shop Assistant Bot",
     description="WhatsApp bot for logging inventory needs to Google Sheets",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Preload chat - served with no-cache headers to prevent browser using stuck cached response
 _CHAT_HTML: str = (STATIC_DIR / "chat.html").read_text(encoding="utf-8")
 
 
+# Hebrew command token -> English command (also used for "Help <command>")
+_HE_COMMANDS: Dict[str, str] = {
+    "מלאי": "List", "מ": "List", "מלאימורחב": "ListExt", "ממ": "ListExt",
+    "ספק": "Sup", "ס": "Sup", "ספקחדש": "Supa", "סח": "Supa",
+    "פריט": "Low", "פ": "Low", "צריך": "Need", "צ": "Need", "ערוך": "Edit", "ער": "Edit",
+    "עזרה": "Help", "ע": "Help", "פם": "Lows", "ם": "Lows", "שפה": "Pref", "הגדרות": "Pref", "ה": "Pref",
+    "חזור": "Back", "ח": "Back", "בטל": "Back", "צא": "Back",
+}
+# Commands that only translate when standalone / only when followed by an argument
+_HE_STANDALONE_ONLY = frozenset({"Sup", "Supa", "Pref", "Back"})
+_HE_NEEDS_ARG = frozenset({"Need", "Edit"})
+# First characters of Hebrew tokens: messages starting with anything else skip the dict lookup
+_HE_COMMAND_FIRST_CHARS = frozenset(tok[0] for tok in _HE_COMMANDS)
+_HE_LISTEXT_FIRST_CHARS = frozenset(tok[0] for tok, cmd in _HE_COMMANDS.items() if cmd == "ListExt")
+
+_RE_NON_DIGIT = re.compile(r"\D")
+
+
 def _normalize_command(body: str, lang: str) -> str:
     """
     Convert Hebrew commands to English equivalents.
@@ -92,75 +273,56 @@ def _normalize_command(body: str, lang: str) -> str:
     if not body:
         return body
     text = body.strip()
-    # ListExt: מלאימורחב or ממ (any language - Hebrew commands)
-    if re.match(r"^(מלאימורחב|ממ)(\s|$)", text):
-        if re.match(r"^(מלאימורחב|ממ)\s+.+", text):
-            text = re.sub(r"^(מלאימורחב|ממ)\s+", "ListExt ", text, count=1)
-        else:
-            text = "ListExt"
-        return text
+    if not text:
+        return body
     if lang != "he":
+        if text[0] not in _HE_LISTEXT_FIRST_CHARS:
+            return body
+    elif text[0] not in _HE_COMMAND_FIRST_CHARS:
+        return text
+    # Command tokens are single words: look up the first word, the rest is the argument
+    parts = text.split(None, 1)
+    cmd = _HE_COMMANDS.get(parts[0])
+    if cmd is None:
+        return text if lang == "he" else body
+    # ListExt: מלאימורחב or ממ (any language - Hebrew commands)
+    if cmd != "ListExt" and lang != "he":
         return body
-    # Low: פריט or פ (with optional space + rest)
-    if re.match(r"^(פריט|פ)(\s|$)", text):
-        text = re.sub(r"^(פריט|פ)(\s+)", "Low ", text, count=1)
-        text = re.sub(r"^(פריט|פ)$", "Low ", text, count=1)
-    # Sup: ספק or ס (standalone)
-    elif re.match(r"^(ספק|ס)\s*$", text):
-        text = "Sup"
-    # Supa: ספקחדש or סח (standalone)
-    elif re.match(r"^(ספקחדש|סח)\s*$", text):
-        text = "Supa"
-    # List: מלאי or מ (standalone or with filter)
-    elif re.match(r"^(מלאי|מ)(\s|$)", text):
-        if re.match(r"^(מלאי|מ)\s+.+", text):
-            text = re.sub(r"^(מלאי|מ)\s+", "List ", text, count=1)
-        else:
-            text = "List"
-    # Help: עזרה or ע (standalone or with command)
-    elif re.match(r"^(עזרה|ע)(\s|$)", text):
-        m = re.match(r"^(עזרה|ע)\s+(.+)$", text)
-        if m:
-            raw = m.group(2).strip()
-            cmd_map = {"מלאי": "List", "מ": "List", "מלאימורחב": "ListExt", "ממ": "ListExt",
-                       "ספק": "Sup", "ס": "Sup", "ספקחדש": "Supa", "סח": "Supa",
-                       "פריט": "Low", "פ": "Low", "צריך": "Need", "צ": "Need", "ערוך": "Edit", "ער": "Edit",
-                       "עזרה": "Help", "ע": "Help", "פם": "Lows", "ם": "Lows", "שפה": "Pref", "הגדרות": "Pref", "ה": "Pref",
-                       "חזור": "Back", "ח": "Back", "בטל": "Back", "צא": "Back"}
-            text = "Help " + cmd_map.get(raw, raw)
-        else:
-            text = "Help"
-    # Need: צריך or צ (only when followed by space + content; standalone is reserved)
-    elif re.match(r"^(צריך|צ)\s+.+", text):
-        text = re.sub(r"^(צריך|צ)(\s+)", "Need ", text, count=1)
-    # Edit: ערוך or ער (only when followed by space + content)
-    elif re.match(r"^(ערוך|ער)\s+.+", text):
-        text = re.sub(r"^(ערוך|ער)(\s+)", "Edit ", text, count=1)
-    # Lows: פם or ם (standalone or with item)
-    elif re.match(r"^(פם|ם)(\s|$)", text):
-        text = re.sub(r"^(פם|ם)(\s+)", "Lows ", text, count=1)
-        text = re.sub(r"^(פם|ם)\s*$", "Lows", text, count=1)
-    # Lang: שפה (standalone) -> Pref (language moved to preferences)
-    elif re.match(r"^שפה\s*$", text):
-        text = "Pref"
-    # Pref: הגדרות or ה (standalone)
-    elif re.match(r"^(הגדרות|ה)\s*$", text):
-        text = "Pref"
-    # Back: חזור, ח, בטל, צא (standalone)
-    elif re.match(r"^(חזור|ח|בטל|צא)\s*$", text):
-        text = "Back"
-    return text
+    arg = parts[1] if len(parts) > 1 else None
+    if not arg:
+        return text if cmd in _HE_NEEDS_ARG else cmd
+    if cmd in _HE_STANDALONE_ONLY:
+        return text
+    if cmd == "Help":
+        arg = arg.strip()
+        return "Help " + _HE_COMMANDS.get(arg, arg)
+    return f"{cmd} {arg}"
+
+
+def _strip_low_prefix(text: str) -> Optional[str]:
+    """Return the rest of a stripped message after 'Low ' or 'L ' (case-insensitive), or None."""
+    head = text[:3].lower()
+    if head == "low":
+        rest = text[3:]
+    elif head[:1] == "l":
+        rest = text[1:]
+    else:
+        return None
+    if not rest[:1].isspace():
+        return None
+    return rest.strip() or None
 
 
 def _has_explicit_low(text: str) -> bool:
     """True if message starts with 'Low ' or 'L ' (case-insensitive)."""
     t = text.strip() if text else ""
-    return bool(t and re.match(r"^(?:low|l)\s+", t, re.IGNORECASE))
+    return bool(t and _strip_low_prefix(t) is not None)
 
 
+@lru_cache(maxsize=1024)  # Pure; the same supplier numbers are looked up repeatedly
 def _format_wa_link(phone: str) -> str:
     """Format phone for WhatsApp wa.me link. Returns empty string if invalid."""
-    digits = re.sub(r"\D", "", phone)
+    digits = _RE_NON_DIGIT.sub("", phone)
     if not digits:
         return ""
     if digits.startswith("0") and len(digits) >= 9:
@@ -170,6 +332,15 @@ def _format_wa_link(phone: str) -> str:
     return f"https://wa.me/{digits}"
 
 
+def _split_trailing_quantity(text: str) -> Tuple[str, Optional[int]]:
+    """Split a stripped "Milk 3" into ("Milk", 3); ("Milk", None) when there is no trailing number."""
+    parts = text.rsplit(None, 1)
+    if len(parts) == 2 and parts[1].isdecimal():
+        return (parts[0], int(parts[1]))
+    return (text, None)
+
+
+@lru_cache(maxsize=256)  # Pure; shops resend the same few items ("Milk", "Low Milk 2")
 def parse_item_and_quantity(body: str) -> Tuple[str, int]:
     """
     Extract item name and quantity from a message.
@@ -179,76 +350,82 @@ def parse_item_and_quantity(body: str) -> Tuple[str, int]:
     - "Beans" or "Low Beans" -> ("Beans", 1)
     - Item followed by number at end = quantity; default is 1.
     """
-    if not body or not body.strip():
-        return ("Unknown Item", 1)
-
-    text = body.strip()
+    text = body.strip() if body else ""
+    if not text:
+        return (UNKNOWN_ITEM, 1)
 
     # Strip "low " or "l " prefix (case-insensitive)
-    match = re.match(r"^(?:low|l)\s+(.+)$", text, re.IGNORECASE)
-    if match:
-        text = match.group(1).strip()
+    rest = _strip_low_prefix(text)
+    if rest is not None:
+        text = rest
 
     # Check for "item N" at end (quantity)
-    qty_match = re.search(r"\s+(\d+)\s*$", text)
-    if qty_match:
-        quantity = int(qty_match.group(1))
-        item = text[: qty_match.start()].strip()
-    else:
-        quantity = 1
-        item = text
+    item, qty = _split_trailing_quantity(text)
+    quantity = qty if qty is not None else 1
 
-    item = item.title() if item else "Unknown Item"
+    item = item.title() if item else UNKNOWN_ITEM
     return (item, quantity)
 
 
 def _parse_item_raw(text: str) -> Optional[Tuple[str, int]]:
     """Parse item and optional quantity (for multi-item mode). Returns None if empty/invalid."""
-    if not text or not text.strip():
+    if not text:
         return None
     item, qty = parse_item_and_quantity(text)
-    if item == "Unknown Item":
+    if item == UNKNOWN_ITEM:
         return None
     return (item, qty)
 
 
-def _t(phone: str, key: str, **kwargs) -> str:
-    """Get translated string for user's language."""
-    return t(key, get_user_lang(phone), **kwargs)
-
-
 def _escape_xml(s: str) -> str:
     """Escape XML special chars for Message body."""
     return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 
+@lru_cache(maxsize=2048)  # Most replies are the same few translated strings
+def _escape_xml_bytes(s: str) -> bytes:
+    """Escaped, UTF-8 encoded Message body."""
+    return _escape_xml(s).encode("utf-8")
+
+
+# Static TwiML scaffolding, pre-encoded; only the escaped message bodies vary per reply
+_TWIML_HEAD = b'<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n'
+_TWIML_MESSAGE_OPEN = b"    <Message>"
+_TWIML_MESSAGE_CLOSE = b"</Message>\n"
+_TWIML_TAIL = b"</Response>"
+_TWIML_SINGLE_HEAD = _TWIML_HEAD + _TWIML_MESSAGE_OPEN
+_TWIML_SINGLE_TAIL = _TWIML_MESSAGE_CLOSE + _TWIML_TAIL
+
+
 def twiml_response(message: str) -> Response:
     """Return a TwiML response for Twilio."""
-    body = _escape_xml(message)
-    twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Message>{body}</Message>
-</Response>"""
+    twiml = _TWIML_SINGLE_HEAD + _escape_xml_bytes(message) + _TWIML_SINGLE_TAIL
     return Response(content=twiml, media_type="application/xml")
 
 
 def twiml_response_multi(messages: List[str]) -> Response:
     """Return TwiML with multiple Message elements (Twilio sends each separately)."""
-    parts = [f"    <Message>{_escape_xml(m)}</Message>" for m in messages]
-    twiml = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<Response>\n" + "\n".join(parts) + "\n</Response>"
-    return Response(content=twiml, media_type="application/xml")
+    parts = b"".join(
+        _TWIML_MESSAGE_OPEN + _escape_xml_bytes(m) + _TWIML_MESSAGE_CLOSE for m in messages
+    )
+    return Response(content=_TWIML_HEAD + parts + _TWIML_TAIL, media_type="application/xml")
+
+
+# Fixed responses for the probe endpoints (hit by Railway/monitoring every few seconds), built once
+_ROOT_RESPONSE = Response(content=b'{"name":"Shop Assistant Bot","status":"running"}', media_type="application/json")
+_HEALTH_RESPONSE = Response(content=b'{"status":"healthy"}', media_type="application/json")
 
 
-@app.get("/")
-async def root() -> dict:
+@app.get("/", response_class=Response)
+async def root() -> Response:
     """Health check / root endpoint."""
-    return {"name": "Shop Assistant Bot", "status": "running"}
+    return _ROOT_RESPONSE
 
 
-@app.get("/health")
-async def health() -> dict:
+@app.get("/health", response_class=Response)
+async def health() -> Response:
     """Health check for Railway and monitoring."""
-    return {"status": "healthy"}
+    return _HEALTH_RESPONSE
 
 
 @app.get("/test-minimal")
@@ -260,25 +437,33 @@ async def test_minimal() -> HTMLResponse:
     )
 
 
+# No-cache headers prevent browser from using stuck cached response
+_CHAT_RESPONSE = HTMLResponse(
+    content=_CHAT_HTML,
+    headers={
+        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+        "Pragma": "no-cache",
+        "Expires": "0",
+    },
+)
+
+
 @app.get("/test")
 async def test_chat() -> HTMLResponse:
-    """WhatsApp-style chat UI. No-cache headers prevent browser from using stuck cached response."""
-    return HTMLResponse(
-        content=_CHAT_HTML,
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0",
-        },
-    )
+    """WhatsApp-style chat UI."""
+    return _CHAT_RESPONSE
+
+
+# Intro response per chat UI language, serialized once (locale files are static)
+_INTRO_BY_LANG: Dict[str, JSONResponse] = {
+    code: JSONResponse({"intro": t("intro", code)}) for code in ("en", "he")
+}
 
 
-@app.get("/intro")
-async def intro(lang: Optional[str] = None) -> dict:
+@app.get("/intro", response_class=JSONResponse)
+async def intro(lang: Optional[str] = None) -> JSONResponse:
     """Return intro message for chat UI. lang: en|he, defaults to app default."""
-    from services.i18n import DEFAULT_LANG
-    code = lang if lang in ("en", "he") else DEFAULT_LANG
-    return {"intro": t("intro", code)}
+    return _INTRO_BY_LANG.get(lang) or _INTRO_BY_LANG[DEFAULT_LANG]
 
 
 @app.get("/guide")
@@ -288,876 +473,941 @@ async def user_guide() -> FileResponse:
     return FileResponse(guide_path, media_type="text/markdown")
 
 
-def _validate_twilio_request(request: Request, form_dict: dict) -> bool:
-    """Validate that the request is from Twilio using X-Twilio-Signature."""
-    auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-    if not auth_token:
-        return True  # Skip validation if token not configured (e.g. local dev)
+# Edit menu per language, with {item_name}/{supplier}/{type_label} left to fill in
+_EDIT_MENU_TEMPLATES: Dict[str, str] = {}
+
+
+def _edit_menu(item_name: str, lang: str) -> str:
+    """Render the Edit menu for an item (supplier, type, then the numbered actions)."""
+    template = _EDIT_MENU_TEMPLATES.get(lang)
+    if template is None:
+        template = "\n".join([
+            t("edit_menu_header", lang),
+            "",
+            "  1. " + t("edit_change_supplier", lang),
+            "  2. " + t("edit_change_type", lang),
+            "  3. " + t("edit_rename", lang),
+            "  4. " + t("edit_delete", lang),
+            "",
+            t("reply_with_number", lang),
+        ])
+        _EDIT_MENU_TEMPLATES[lang] = template
+    item = get_item(item_name) or {}
+    sid = item.get("supplier_id")
+    itype = item.get("type") or "Raw"
+    s = get_by_id(sid) if sid else None
+    sup_name = s.get("company_name", "") if s else t("list_no_supplier", lang)
+    type_label = t("type_prep", lang) if itype == "Prep" else t("type_raw", lang)
+    return template.format(item_name=item_name, supplier=sup_name, type_label=type_label)
+
+
+def _validate_twilio_request(request: Request, form_dict: Dict[str, str]) -> bool:
+    """Validate that the request is from Twilio using X-Twilio-Signature. Requires _twilio_validator."""
     signature = request.headers.get("X-Twilio-Signature", "")
-    url = str(request.url)
-    validator = RequestValidator(auth_token)
-    return validator.validate(url, form_dict, signature)
+    url = _TWILIO_WEBHOOK_URL or str(request.url)
+    return _twilio_validator.validate(url, form_dict, signature)
+
+
+def _append_inventory_row_logged(**kwargs) -> None:
+    """Background task: append one row to the sheet, logging failures (the user was already answered)."""
+    try:
+        append_inventory_row(**kwargs)
+    except Exception:
+        logger.exception("Sheets append failed")
+
+
+def _append_inventory_rows_logged(rows: List[Tuple[str, int, Optional[str], str]], sender_phone: str) -> None:
+    """Background task: append a batch of rows to the sheet, logging failures."""
+    try:
+        append_inventory_rows(rows, sender_phone)
+    except Exception:
+        logger.exception("Sheets batch append failed")
+
+
+def _schedule_inventory_rows(
+    background_tasks: BackgroundTasks,
+    rows: List[Tuple[str, int, Optional[str], str]],
+    sender_phone: str,
+) -> None:
+    """Queue (or schedule after the response) a batch of (item_name, quantity, supplier_name, item_type) rows."""
+    if _sheets_queue is not None:
+        for item_name, qty, sup_name, itype in rows:
+            _sheets_queue.put_nowait(
+                build_inventory_row(item_name, sender_phone, qty, LOW_STOCK, sup_name, itype)
+            )
+    else:
+        background_tasks.add_task(_append_inventory_rows_logged, rows, sender_phone)
+
+
+def _bullet_list(lines: List[str]) -> str:
+    """Format summary lines as a "  • " bullet list (one join, no per-line concatenation)."""
+    return "  • " + "\n  • ".join(lines)
+
+
+def _record_quantities(
+    background_tasks: BackgroundTasks,
+    entries: List[Tuple[str, int]],
+    sender_phone: str,
+) -> List[str]:
+    """Record (item_name, quantity) reports from Lows/multi-item mode: one items and suppliers read,
+    one sheet batch, one items DB write. Returns the display lines ("Milk×2")."""
+    items_by_name = {i.get("name", "").lower(): i for i in get_all_items()}
+    suppliers_by_id = {s.get("id"): s for s in get_all()}
+    rows_for_sheets: List[Tuple[str, int, Optional[str], str]] = []
+    db_entries: List[Tuple[str, Optional[str], str, int]] = []
+    added: List[str] = []
+    for item_name, qty in entries:
+        item = items_by_name.get(item_name.strip().lower(), {})
+        sid = item.get("supplier_id")
+        itype = item.get("type") or "Raw"
+        s = suppliers_by_id.get(sid) if sid else None
+        rows_for_sheets.append((item_name, qty, s.get("company_name", "") if s else None, itype))
+        db_entries.append((item_name, sid, itype, qty))
+        added.append(f"{item_name}×{qty}" if qty > 1 else item_name)
+    _schedule_inventory_rows(background_tasks, rows_for_sheets, sender_phone)
+    add_items(db_entries, updated_by=sender_phone)
+    return added
 
 
 def _do_append_and_confirm(
+    background_tasks: BackgroundTasks,
     item_name: str,
     quantity: int,
     sender_phone: str,
+    lang: str,
     supplier_id: Optional[str] = None,
     item_type: str = "Raw",
 ) -> str:
-    """Append to sheet, add to items DB, return success message."""
+    """Queue (or schedule after the response) the sheet append, add to items DB, return success message."""
     supplier_name = None
     if supplier_id:
         s = get_by_id(supplier_id)
         supplier_name = s.get("company_name", "") if s else None
-    try:
-        append_inventory_row(
-            item_name=item_name,
-            sender_phone=sender_phone,
-            quantity=quantity,
-            status="Low Stock",
-            supplier_name=supplier_name,
-            item_type=item_type,
+    row_kwargs = dict(
+        item_name=item_name,
+        sender_phone=sender_phone,
+        quantity=quantity,
+        status=LOW_STOCK,
+        supplier_name=supplier_name,
+        item_type=item_type,
+    )
+    if _sheets_queue is not None:
+        _sheets_queue.put_nowait(build_inventory_row(**row_kwargs))
+    else:
+        background_tasks.add_task(_append_inventory_row_logged, **row_kwargs)
+    add_item(item_name, supplier_id, item_type, quantity, updated_by=sender_phone)
+    if quantity > 1:
+        return t("added_to_list_qty", lang, item_name=item_name, quantity=quantity)
+    return t("added_to_list", lang, item_name=item_name)
+
+
+def _handle_new_item(
+    state: Tuple[str, int], body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending new-item confirmation: yes -> type selection, no -> cancel."""
+    item_name, quantity = state
+    if body_lower in _YES_WORDS:
+        _pending[sender_phone] = (PendingKind.TYPE_SELECTION, (item_name, quantity, None))
+        return twiml_response(t("type_select", lang))
+    if body_lower in _NO_WORDS or body_text == "!":
+        _pending.pop(sender_phone, None)
+        return twiml_response(t("cancelled", lang))
+    return twiml_response(t("reply_yes_no_new_item", lang))
+
+
+def _handle_supplier_selection(
+    state: Tuple[str, int], body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending supplier selection (after choosing Raw for new item)."""
+    item_name, quantity = state
+    suppliers = get_numbered_list()
+    if not suppliers:
+        _pending.pop(sender_phone, None)
+        reply = _do_append_and_confirm(
+            background_tasks, item_name, quantity, sender_phone, lang, None, "Raw"
         )
-        add_item(item_name, supplier_id, item_type, quantity, updated_by=sender_phone)
-        if quantity > 1:
-            return _t(sender_phone, "added_to_list_qty", item_name=item_name, quantity=quantity)
-        return _t(sender_phone, "added_to_list", item_name=item_name)
-    except (ValueError, Exception) as e:
-        print(f"[ERROR] Sheets append failed: {e}")
-        return _t(sender_phone, "could_not_add", item_name=item_name)
-
-
-@app.post("/whatsapp")
-async def whatsapp_webhook(request: Request) -> Response:
-    """
-    Twilio webhook for incoming WhatsApp messages.
-
-    Supports:
-    - Single item: "Low Milk", "Milk 2" (default = Low), "!" reserved
-    - Pending new-item: reply yes/no to add new item
-    - Multi-item mode: "Lows" then items (existing only), "!" to finish
-    """
-    form = await request.form()
-    form_dict = {k: v for k, v in form.items() if isinstance(v, str)}
-
-    if not _validate_twilio_request(request, form_dict):
-        return Response(status_code=403, content="Invalid signature")
-
-    body_text = (form_dict.get("Body", "") or "").strip()
-    sender_phone = form_dict.get("From", "Unknown")
-
-    # Normalize Hebrew commands to English when in Hebrew mode
-    body_text = _normalize_command(body_text, get_user_lang(sender_phone))
+        return twiml_response(reply)
+    try:
+        num = int(body_text)
+        if 1 <= num <= len(suppliers):
+            _, sup = suppliers[num - 1]
+            _pending.pop(sender_phone, None)
+            reply = _do_append_and_confirm(
+                background_tasks, item_name, quantity, sender_phone, lang, sup.get("id"), "Raw"
+            )
+            return twiml_response(reply)
+    except ValueError:
+        pass
+    return twiml_response(t("reply_number_range", lang, max=len(suppliers)))
 
-    # --- Reserved: "!" is never an item ---
-    if body_text == "!":
-        if sender_phone in _pending_new_item:
-            _pending_new_item.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_supplier_selection:
-            _pending_supplier_selection.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_type_selection:
-            _pending_type_selection.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_preferences:
-            _pending_preferences.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_edit:
-            _pending_edit.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_add_supplier:
-            _pending_add_supplier.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_supplier_details:
-            _pending_supplier_details.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_lows_fill:
-            _pending_lows_fill.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone in _pending_need_fill:
-            _pending_need_fill.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        if sender_phone not in _multi_mode_sessions:
-            return twiml_response(_t(sender_phone, "exclamation_reserved"))
 
-    # --- Back: go back one step in any pending state ---
-    if re.match(r"^(?:back|b|exit|quit|cancel)\s*$", body_text, re.IGNORECASE):
-        if sender_phone in _pending_add_supplier:
-            state = _pending_add_supplier[sender_phone]
-            step = state.get("step", 1)
-            if step == 3:
-                state["step"] = 2
-                return twiml_response(_t(sender_phone, "contact_name_prompt"))
-            if step == 2:
-                state["step"] = 1
-                return twiml_response(_t(sender_phone, "company_name_prompt"))
-            _pending_add_supplier.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_supplier_details:
-            _pending_supplier_details.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_preferences:
-            _pending_preferences.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_type_selection:
-            _pending_type_selection.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_supplier_selection:
-            item_name, quantity = _pending_supplier_selection.pop(sender_phone)
-            _pending_type_selection[sender_phone] = (item_name, quantity, None)
-            return twiml_response(_t(sender_phone, "type_select"))
-        if sender_phone in _pending_new_item:
-            _pending_new_item.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_lows_fill:
-            _pending_lows_fill.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_need_fill:
-            _pending_need_fill.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        if sender_phone in _pending_edit:
-            state = _pending_edit[sender_phone]
-            if state.get("step") == "type_raw_supplier":
-                state["step"] = "type"
-                state.pop("type_raw_suppliers", None)
-                return twiml_response(_t(sender_phone, "type_select"))
-            if state.get("step") in ("supplier", "type", "rename", "delete_confirm"):
-                state["step"] = "menu"
-                item_name = state.get("item_name", "")
-                sid = get_item_supplier_id(item_name)
-                itype = get_item_type(item_name)
-                s = get_by_id(sid) if sid else None
-                sup_name = s.get("company_name", "") if s else _t(sender_phone, "list_no_supplier")
-                type_label = _t(sender_phone, "type_prep") if itype == "Prep" else _t(sender_phone, "type_raw")
-                lines = [
-                    _t(sender_phone, "edit_menu_header", item_name=item_name, supplier=sup_name, type_label=type_label),
-                    "",
-                    "  1. " + _t(sender_phone, "edit_change_supplier"),
-                    "  2. " + _t(sender_phone, "edit_change_type"),
-                    "  3. " + _t(sender_phone, "edit_rename"),
-                    "  4. " + _t(sender_phone, "edit_delete"),
-                    "",
-                    _t(sender_phone, "reply_with_number"),
-                ]
+def _handle_type_selection(
+    state: Tuple[str, int, Optional[str]], body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending type selection (type first for new item)."""
+    item_name, quantity, _ = state
+    try:
+        num = int(body_text)
+        if num == 1:
+            # Raw: show supplier list (or add with None if no suppliers)
+            _pending.pop(sender_phone, None)
+            suppliers = get_numbered_list()
+            if suppliers:
+                _pending[sender_phone] = (PendingKind.SUPPLIER_SELECTION, (item_name, quantity))
+                lines = [t("select_supplier", lang), ""]
+                for i, s in suppliers:
+                    lines.append(f"  {i}. {s.get('company_name', '?')}")
+                lines.extend(["", t("reply_with_number", lang)])
                 return twiml_response("\n".join(lines))
-            _pending_edit.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "back_cancelled"))
-        return twiml_response(_t(sender_phone, "back_no_step"))
-
-    # --- Pending Lows fill: quantity for current item (empty = 0) ---
-    # Check early so numeric replies (0, 3, etc.) are not consumed by other handlers
-    if sender_phone in _pending_lows_fill:
-        state = _pending_lows_fill[sender_phone]
-        items_list = state["items"]
-        idx = state["index"]
+            reply = _do_append_and_confirm(
+                background_tasks, item_name, quantity, sender_phone, lang, None, "Raw"
+            )
+            return twiml_response(reply)
+        if num == 2:
+            # Prep: use prep supplier, no supplier selection
+            _pending.pop(sender_phone, None)
+            prep_sid = get_valid_prep_supplier_id(get_by_id)
+            reply = _do_append_and_confirm(
+                background_tasks, item_name, quantity, sender_phone, lang, prep_sid, "Prep"
+            )
+            return twiml_response(reply)
+    except ValueError:
+        pass
+    return twiml_response(t("reply_type_raw_prep", lang))
+
+
+def _handle_add_supplier(
+    state: SupplierDraft, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending add supplier (multi-step: company, contact, number)."""
+    step = state.step
+    if step == 1:
+        state.company_name = body_text
+        state.step = 2
+        return twiml_response(t("contact_name_prompt", lang))
+    if step == 2:
+        state.contact_name = body_text
+        state.step = 3
+        return twiml_response(t("contact_number_prompt", lang))
+    if step == 3:
+        sid = add_supplier(
+            state.company_name,
+            state.contact_name,
+            body_text,
+        )
+        _pending.pop(sender_phone, None)
+        return twiml_response(t("supplier_added", lang, company_name=state.company_name))
+    return None
+
+
+def _handle_supplier_details(
+    state: bool, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending supplier details (user sent Sup, awaiting number)."""
+    suppliers = get_numbered_list()
+    if not suppliers:
+        _pending.pop(sender_phone, None)
+        return twiml_response(t("no_suppliers_yet", lang))
+    try:
+        num = int(body_text)
+        if 1 <= num <= len(suppliers):
+            _, sup = suppliers[num - 1]
+            _pending.pop(sender_phone, None)
+            company = sup.get("company_name", "?")
+            contact = sup.get("contact_name", "")
+            phone = sup.get("contact_number", "")
+            wa_url = _format_wa_link(phone) if phone else ""
+            chat_line = t("supplier_chat", lang, wa_url=wa_url) if wa_url else ""
+            details_msg = t(
+                "supplier_details", lang,
+                company=company, contact=contact, contact_number=phone, chat_line=chat_line
+            )
+            # Order in separate message for easy copy-paste to supplier
+            supplier_items = get_items_by_supplier(sup.get("id", ""))
+            item_lines = []
+            for it in supplier_items:
+                qty = it.get("quantity", 1)
+                req = it.get("required_quantity", 0)
+                order_qty = max(0, req - qty)
+                item_lines.append(t("supplier_item_line", lang, name=it.get("name", "?"), order_qty=order_qty))
+            order_body = "\n".join(item_lines) if item_lines else t("supplier_no_items", lang)
+            order_msg = t("order_header", lang) + "\n" + order_body
+            return twiml_response_multi([details_msg, order_msg])
+    except ValueError:
+        pass
+    return twiml_response(t("reply_number_range", lang, max=len(suppliers)))
+
+
+def _handle_preferences(
+    state: str, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending preferences: state is "menu" | "lang" | "prep_supplier"."""
+    if state == "menu":
         try:
-            qty = int(body_text.strip()) if body_text.strip() else 0
+            num = int(body_text)
+            if num == 1:
+                _pending[sender_phone] = (PendingKind.PREFERENCES, "lang")
+                langs = get_supported_langs(lang)
+                lines = [t("lang_supported", lang), ""]
+                for i, (code, name) in enumerate(langs, 1):
+                    lines.append(f"  {i}. {name}")
+                lines.extend(["", t("lang_select", lang)])
+                return twiml_response("\n".join(lines))
+            if num == 2:
+                suppliers = get_numbered_list()
+                if not suppliers:
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("pref_no_suppliers", lang))
+                _pending[sender_phone] = (PendingKind.PREFERENCES, "prep_supplier")
+                lines = [t("pref_prep_supplier_prompt", lang), ""]
+                for i, s in suppliers:
+                    lines.append(f"  {i}. {s.get('company_name', '?')}")
+                lines.extend(["", t("reply_with_number", lang)])
+                return twiml_response("\n".join(lines))
         except ValueError:
-            qty = 0
-        if qty < 0:
-            qty = 0
-        if qty > 0:
-            it = items_list[idx]
-            state["collected"].append((it["name"], qty))
-        idx += 1
-        if idx >= len(items_list):
-            _pending_lows_fill.pop(sender_phone, None)
-            collected = state["collected"]
-            if not collected:
-                return twiml_response(_t(sender_phone, "multi_mode_ended_empty"))
-            rows_for_sheets: List[Tuple[str, int, Optional[str], str]] = []
-            for item_name, qty in collected:
-                sid = get_item_supplier_id(item_name)
-                itype = get_item_type(item_name)
-                s = get_by_id(sid) if sid else None
-                sup_name = s.get("company_name", "") if s else None
-                rows_for_sheets.append((item_name, qty, sup_name, itype))
-            try:
-                append_inventory_rows(rows_for_sheets, sender_phone)
-            except (ValueError, Exception) as e:
-                print(f"[ERROR] Sheets batch append failed: {e}")
-            added: List[str] = []
-            for item_name, qty in collected:
-                sid = get_item_supplier_id(item_name)
-                itype = get_item_type(item_name)
-                add_item(item_name, sid, itype, qty, updated_by=sender_phone)
-                added.append(f"{item_name}×{qty}" if qty > 1 else item_name)
-            items_str = "  • " + "\n  • ".join(added)
-            return twiml_response(_t(sender_phone, "added_items", count=len(added), items=items_str))
-        state["index"] = idx
-        next_it = items_list[idx]
-        return twiml_response(_t(sender_phone, "lows_fill_quantity_prompt", item_name=next_it["name"], num=idx + 1, total=len(items_list)))
-
-    # --- Pending Need fill: required quantity for current item (empty = 0) ---
-    if sender_phone in _pending_need_fill:
-        state = _pending_need_fill[sender_phone]
-        items_list = state["items"]
-        idx = state["index"]
+            pass
+        return twiml_response(t("reply_number_range", lang, max=2))
+    if state == "lang":
         try:
-            req_qty = int(body_text.strip()) if body_text.strip() else 0
+            num = int(body_text)
+            langs = get_supported_langs(lang)
+            if 1 <= num <= len(langs):
+                code, name = langs[num - 1]
+                set_user_lang(sender_phone, code)
+                lang = code
+                _pending.pop(sender_phone, None)
+                return twiml_response(t("lang_set", lang, lang_name=name))
         except ValueError:
-            req_qty = 0
-        if req_qty < 0:
-            req_qty = 0
-        it = items_list[idx]
-        state["collected"].append((it["name"], req_qty))
-        idx += 1
-        if idx >= len(items_list):
-            _pending_need_fill.pop(sender_phone, None)
-            collected = state["collected"]
-            if not collected:
-                return twiml_response(_t(sender_phone, "need_fill_ended_empty"))
-            updated: List[str] = []
-            for item_name, req_qty in collected:
-                if set_required_quantity(item_name, req_qty):
-                    updated.append(f"{item_name}→{req_qty}" if req_qty else item_name)
-            if not updated:
-                return twiml_response(_t(sender_phone, "need_fill_ended_empty"))
-            items_str = "  • " + "\n  • ".join(updated)
-            return twiml_response(_t(sender_phone, "need_fill_updated", count=len(updated), items=items_str))
-        state["index"] = idx
-        next_it = items_list[idx]
-        return twiml_response(_t(sender_phone, "need_fill_quantity_prompt", item_name=next_it["name"], num=idx + 1, total=len(items_list)))
-
-    # --- Pending edit (Edit Milk -> menu -> supplier/type/rename/delete) ---
-    if sender_phone in _pending_edit:
-        state = _pending_edit[sender_phone]
-        step = state.get("step", "menu")
-        item_name = state.get("item_name", "")
-
-        if step == "menu":
-            try:
-                num = int(body_text.strip())
-                if num == 1:
-                    suppliers = get_numbered_list()
-                    if not suppliers:
-                        _pending_edit.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "edit_no_suppliers"))
-                    state["step"] = "supplier"
-                    lines = [_t(sender_phone, "select_supplier"), ""]
-                    for i, s in suppliers:
-                        lines.append(f"  {i}. {s.get('company_name', '?')}")
-                    lines.extend(["", _t(sender_phone, "reply_with_number")])
-                    return twiml_response("\n".join(lines))
-                if num == 2:
-                    state["step"] = "type"
-                    return twiml_response(_t(sender_phone, "type_select"))
-                if num == 3:
-                    state["step"] = "rename"
-                    return twiml_response(_t(sender_phone, "edit_rename_prompt", item_name=item_name))
-                if num == 4:
-                    state["step"] = "delete_confirm"
-                    return twiml_response(_t(sender_phone, "edit_delete_confirm", item_name=item_name))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_number_range", max=4))
-
-        if step == "supplier":
-            suppliers = get_numbered_list()
-            try:
-                num = int(body_text.strip())
-                if 1 <= num <= len(suppliers):
-                    _, sup = suppliers[num - 1]
-                    sid = sup.get("id", "")
-                    if update_item_supplier(item_name, sid):
-                        _pending_edit.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "edit_supplier_updated", item_name=item_name, company=sup.get("company_name", "?")))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_number_range", max=len(suppliers)))
-
-        if step == "type":
-            try:
-                num = int(body_text.strip())
-                if num == 1:
-                    # Prep → Raw: must choose a supplier other than the prep supplier
-                    current_type = get_item_type(item_name)
-                    current_sid = get_item_supplier_id(item_name)
-                    if current_type == "Prep" and current_sid:
-                        all_suppliers = get_numbered_list()
-                        filtered = [s for _, s in all_suppliers if s.get("id") != current_sid]
-                        other_suppliers = [(i, s) for i, s in enumerate(filtered, 1)]
-                        if not other_suppliers:
-                            _pending_edit.pop(sender_phone, None)
-                            return twiml_response(_t(sender_phone, "edit_prep_to_raw_no_other_supplier"))
-                        state["step"] = "type_raw_supplier"
-                        state["type_raw_suppliers"] = other_suppliers
-                        lines = [_t(sender_phone, "edit_prep_to_raw_select_supplier"), ""]
-                        for i, s in other_suppliers:
-                            lines.append(f"  {i}. {s.get('company_name', '?')}")
-                        lines.extend(["", _t(sender_phone, "reply_with_number")])
-                        return twiml_response("\n".join(lines))
-                    if update_item_type(item_name, "Raw"):
-                        _pending_edit.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "edit_type_updated", item_name=item_name, type_label=_t(sender_phone, "type_raw")))
-                if num == 2:
-                    # Raw → Prep: set supplier to default prep supplier (must exist)
-                    prep_sid = get_valid_prep_supplier_id(get_by_id)
-                    if prep_sid:
-                        update_item_supplier(item_name, prep_sid)
-                    if update_item_type(item_name, "Prep"):
-                        _pending_edit.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "edit_type_updated", item_name=item_name, type_label=_t(sender_phone, "type_prep")))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_type_raw_prep"))
-
-        if step == "type_raw_supplier":
-            suppliers = state.get("type_raw_suppliers", [])
-            try:
-                num = int(body_text.strip())
-                if 1 <= num <= len(suppliers):
-                    _, sup = suppliers[num - 1]
-                    sid = sup.get("id", "")
-                    if update_item_supplier(item_name, sid) and update_item_type(item_name, "Raw"):
-                        _pending_edit.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "edit_type_updated", item_name=item_name, type_label=_t(sender_phone, "type_raw")))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_number_range", max=len(suppliers)))
-
-        if step == "rename":
-            new_name = body_text.strip()
-            if not new_name:
-                return twiml_response(_t(sender_phone, "edit_rename_empty"))
-            if is_known_item(new_name) and get_item_canonical_name(new_name) != item_name:
-                return twiml_response(_t(sender_phone, "edit_rename_exists", new_name=new_name))
-            if rename_item(item_name, new_name):
-                _pending_edit.pop(sender_phone, None)
-                return twiml_response(_t(sender_phone, "edit_renamed", old_name=item_name, new_name=new_name))
-            return twiml_response(_t(sender_phone, "edit_rename_failed"))
-
-        if step == "delete_confirm":
-            body_clean = body_text.strip()
-            body_lower = body_clean.lower()
-            if body_lower in ("yes", "y", "ye") or body_clean in ("כן", "כ"):
-                if delete_item(item_name):
-                    _pending_edit.pop(sender_phone, None)
-                    return twiml_response(_t(sender_phone, "edit_deleted", item_name=item_name))
-            if body_lower in ("no", "n") or body_clean in ("לא", "ל"):
-                _pending_edit.pop(sender_phone, None)
-                return twiml_response(_t(sender_phone, "cancelled"))
-            return twiml_response(_t(sender_phone, "edit_delete_reply_yes_no"))
-
-    # --- Pending add supplier (multi-step) ---
-    if sender_phone in _pending_add_supplier:
-        state = _pending_add_supplier[sender_phone]
-        step = state.get("step", 1)
-        if step == 1:
-            state["company_name"] = body_text
-            state["step"] = 2
-            return twiml_response(_t(sender_phone, "contact_name_prompt"))
-        if step == 2:
-            state["contact_name"] = body_text
-            state["step"] = 3
-            return twiml_response(_t(sender_phone, "contact_number_prompt"))
-        if step == 3:
-            sid = add_supplier(
-                state["company_name"],
-                state["contact_name"],
-                body_text,
-            )
-            _pending_add_supplier.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "supplier_added", company_name=state["company_name"]))
-
-    # --- Pending supplier details (user sent Sup, awaiting number) ---
-    if sender_phone in _pending_supplier_details:
+            pass
+        return twiml_response(t("lang_select", lang))
+    if state == "prep_supplier":
         suppliers = get_numbered_list()
-        if not suppliers:
-            _pending_supplier_details.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "no_suppliers_yet"))
         try:
-            num = int(body_text.strip())
+            num = int(body_text)
             if 1 <= num <= len(suppliers):
                 _, sup = suppliers[num - 1]
-                _pending_supplier_details.pop(sender_phone, None)
-                company = sup.get("company_name", "?")
-                contact = sup.get("contact_name", "")
-                phone = sup.get("contact_number", "")
-                wa_url = _format_wa_link(phone) if phone else ""
-                chat_line = _t(sender_phone, "supplier_chat", wa_url=wa_url) if wa_url else ""
-                details_msg = _t(
-                    sender_phone, "supplier_details",
-                    company=company, contact=contact, contact_number=phone, chat_line=chat_line
-                )
-                # Order in separate message for easy copy-paste to supplier
-                supplier_items = get_items_by_supplier(sup.get("id", ""))
-                item_lines = []
-                for it in supplier_items:
-                    qty = it.get("quantity", 1)
-                    req = it.get("required_quantity", 0)
-                    order_qty = max(0, req - qty)
-                    item_lines.append(_t(sender_phone, "supplier_item_line", name=it.get("name", "?"), order_qty=order_qty))
-                order_body = "\n".join(item_lines) if item_lines else _t(sender_phone, "supplier_no_items")
-                order_msg = _t(sender_phone, "order_header") + "\n" + order_body
-                return twiml_response_multi([details_msg, order_msg])
+                sid = sup.get("id", "")
+                count = set_prep_items_supplier(sid)
+                _pending.pop(sender_phone, None)
+                return twiml_response(t("pref_prep_supplier_set", lang, company=sup.get("company_name", "?"), count=count))
         except ValueError:
             pass
-        return twiml_response(_t(sender_phone, "reply_number_range", max=len(suppliers)))
+        return twiml_response(t("reply_number_range", lang, max=len(suppliers)))
+    return None
+
 
-    # --- Pending type selection (type first for new item) ---
-    if sender_phone in _pending_type_selection:
-        item_name, quantity, supplier_id = _pending_type_selection[sender_phone]
+def _handle_edit(
+    state: EditState, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending edit (Edit Milk -> menu -> supplier/type/rename/delete)."""
+    step = state.step
+    item_name = state.item_name
+
+    if step == "menu":
         try:
-            num = int(body_text.strip())
+            num = int(body_text)
             if num == 1:
-                # Raw: show supplier list (or add with None if no suppliers)
-                _pending_type_selection.pop(sender_phone, None)
                 suppliers = get_numbered_list()
-                if suppliers:
-                    _pending_supplier_selection[sender_phone] = (item_name, quantity)
-                    lines = [_t(sender_phone, "select_supplier"), ""]
-                    for i, s in suppliers:
-                        lines.append(f"  {i}. {s.get('company_name', '?')}")
-                    lines.extend(["", _t(sender_phone, "reply_with_number")])
-                    return twiml_response("\n".join(lines))
-                reply = _do_append_and_confirm(
-                    item_name, quantity, sender_phone, None, "Raw"
-                )
-                return twiml_response(reply)
+                if not suppliers:
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("edit_no_suppliers", lang))
+                state.step = "supplier"
+                lines = [t("select_supplier", lang), ""]
+                for i, s in suppliers:
+                    lines.append(f"  {i}. {s.get('company_name', '?')}")
+                lines.extend(["", t("reply_with_number", lang)])
+                return twiml_response("\n".join(lines))
             if num == 2:
-                # Prep: use prep supplier, no supplier selection
-                _pending_type_selection.pop(sender_phone, None)
-                prep_sid = get_valid_prep_supplier_id(get_by_id)
-                reply = _do_append_and_confirm(
-                    item_name, quantity, sender_phone, prep_sid, "Prep"
-                )
-                return twiml_response(reply)
+                state.step = "type"
+                return twiml_response(t("type_select", lang))
+            if num == 3:
+                state.step = "rename"
+                return twiml_response(t("edit_rename_prompt", lang, item_name=item_name))
+            if num == 4:
+                state.step = "delete_confirm"
+                return twiml_response(t("edit_delete_confirm", lang, item_name=item_name))
         except ValueError:
             pass
-        return twiml_response(_t(sender_phone, "reply_type_raw_prep"))
+        return twiml_response(t("reply_number_range", lang, max=4))
 
-    # --- Pending supplier selection (after choosing Raw for new item) ---
-    if sender_phone in _pending_supplier_selection:
-        item_name, quantity = _pending_supplier_selection[sender_phone]
+    if step == "supplier":
         suppliers = get_numbered_list()
-        if not suppliers:
-            _pending_supplier_selection.pop(sender_phone, None)
-            reply = _do_append_and_confirm(
-                item_name, quantity, sender_phone, None, "Raw"
-            )
-            return twiml_response(reply)
         try:
-            num = int(body_text.strip())
+            num = int(body_text)
             if 1 <= num <= len(suppliers):
                 _, sup = suppliers[num - 1]
-                _pending_supplier_selection.pop(sender_phone, None)
-                reply = _do_append_and_confirm(
-                    item_name, quantity, sender_phone, sup.get("id"), "Raw"
-                )
-                return twiml_response(reply)
+                sid = sup.get("id", "")
+                if update_item_supplier(item_name, sid):
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("edit_supplier_updated", lang, item_name=item_name, company=sup.get("company_name", "?")))
         except ValueError:
             pass
-        return twiml_response(_t(sender_phone, "reply_number_range", max=len(suppliers)))
-
-    # --- Pending new-item confirmation ---
-    if sender_phone in _pending_new_item:
-        body_clean = body_text.strip()
-        body_lower = body_clean.lower()
-        if body_lower in ("yes", "y", "ye") or body_clean in ("כן", "כ"):
-            item_name, quantity = _pending_new_item.pop(sender_phone)
-            _pending_type_selection[sender_phone] = (item_name, quantity, None)
-            return twiml_response(_t(sender_phone, "type_select"))
-        if body_lower in ("no", "n") or body_clean in ("לא", "ל") or body_text == "!":
-            _pending_new_item.pop(sender_phone, None)
-            return twiml_response(_t(sender_phone, "cancelled"))
-        return twiml_response(_t(sender_phone, "reply_yes_no_new_item"))
-
-    # --- Multi-item mode: end with "!" ---
-    if sender_phone in _multi_mode_sessions:
-        if body_text == "!":
-            items = _multi_mode_sessions.pop(sender_phone)
-            if not items:
-                return twiml_response(_t(sender_phone, "multi_mode_ended_empty"))
-            rows_for_sheets: List[Tuple[str, int, Optional[str], str]] = []
-            for item_name, qty in items:
-                sid = get_item_supplier_id(item_name)
-                itype = get_item_type(item_name)
-                s = get_by_id(sid) if sid else None
-                sup_name = s.get("company_name", "") if s else None
-                rows_for_sheets.append((item_name, qty, sup_name, itype))
-            try:
-                append_inventory_rows(rows_for_sheets, sender_phone)
-            except (ValueError, Exception) as e:
-                print(f"[ERROR] Sheets batch append failed: {e}")
-            added: List[str] = []
-            for item_name, qty in items:
-                sid = get_item_supplier_id(item_name)
-                itype = get_item_type(item_name)
-                add_item(item_name, sid, itype, qty, updated_by=sender_phone)
-                added.append(f"{item_name}×{qty}" if qty > 1 else item_name)
-            items_list = "  • " + "\n  • ".join(added)
-            return twiml_response(_t(sender_phone, "added_items", count=len(added), items=items_list))
-
-        # In multi mode: only existing items
-        parsed = _parse_item_raw(body_text)
-        if parsed:
-            item_name, qty = parsed
-            if not is_known_item(item_name):
-                return twiml_response(
-                    _t(sender_phone, "item_not_in_list_multi", item_name=item_name)
-                )
-            _multi_mode_sessions[sender_phone].append((item_name, qty))
-            part = f"{item_name}×{qty}" if qty > 1 else item_name
-            return twiml_response(_t(sender_phone, "added_part_send_more", part=part))
-        return twiml_response(_t(sender_phone, "send_existing_or_finish"))
-
-    # --- Multi-item mode: start with "Lows" / "S" / "פם" / "ם" ---
-    if re.match(r"^(?:lows|s)\s*$", body_text, re.IGNORECASE):
-        _multi_mode_sessions[sender_phone] = []
-        return twiml_response(_t(sender_phone, "multi_mode_start"))
-
-    match = re.match(r"^(?:lows|s)\s+(.+)$", body_text, re.IGNORECASE)
-    if match:
-        rest = match.group(1).strip()
-        parsed = _parse_item_raw(rest)
-        if parsed:
-            item_name, qty = parsed
-            if is_known_item(item_name):
-                _multi_mode_sessions[sender_phone] = [(item_name, qty)]
-                part = f"{item_name}×{qty}" if qty > 1 else item_name
-                return twiml_response(_t(sender_phone, "multi_mode_added_part", part=part))
-        # Not a known item: try supplier regex for easy fill (פם <supplier_regex>)
-        supplier_pattern = rest
-        if not supplier_pattern:
-            _multi_mode_sessions[sender_phone] = []
-            return twiml_response(_t(sender_phone, "multi_mode_send_existing"))
-        # Cancel any blocking pending state so Lows fill can start
-        _pending_supplier_selection.pop(sender_phone, None)
-        _pending_type_selection.pop(sender_phone, None)
-        _pending_new_item.pop(sender_phone, None)
+        return twiml_response(t("reply_number_range", lang, max=len(suppliers)))
+
+    if step == "type":
         try:
-            pat = re.compile(supplier_pattern, re.IGNORECASE)
-        except re.error:
-            return twiml_response(_t(sender_phone, "list_invalid_regex", pattern=supplier_pattern))
-        suppliers = get_all()
-        matching = [s for s in suppliers if pat.search(s.get("company_name", "") or "")]
-        if not matching:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_pattern))
-        all_items: List[dict] = []
-        for s in matching:
-            for it in get_items_by_supplier(s.get("id", "")):
-                all_items.append({
-                    "name": it.get("name", ""),
-                    "supplier_id": it.get("supplier_id"),
-                    "type": it.get("type", "Raw"),
-                })
-        if not all_items:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_pattern))
-        _pending_lows_fill[sender_phone] = {"items": all_items, "index": 0, "collected": []}
-        first = all_items[0]
-        return twiml_response(_t(sender_phone, "lows_fill_quantity_prompt", item_name=first["name"], num=1, total=len(all_items)))
-
-    # --- Help: show all commands or detailed help for one command ---
-    help_match = re.match(r"^(?:help|h)\s+(.+)$", body_text, re.IGNORECASE)
-    if help_match:
-        cmd = help_match.group(1).strip().lower()
-        detail_map = {
-            "low": "help_low_detail", "l": "help_low_detail", "sup": "help_sup_detail", "supa": "help_supa_detail",
-            "list": "help_list_detail", "listext": "help_listext_detail", "ext": "help_listext_detail",
-            "need": "help_need_detail", "n": "help_need_detail",
-            "needfill": "help_need_fill_detail", "need_fill": "help_need_fill_detail",
-            "edit": "help_edit_detail", "e": "help_edit_detail",
-            "help": "help_help_detail", "h": "help_help_detail", "lows": "help_lows_detail", "s": "help_lows_detail",
-            "lowsfill": "help_lows_fill_detail", "lows_fill": "help_lows_fill_detail",
-            "lang": "help_lang_detail", "pref": "help_pref_detail", "p": "help_pref_detail",
-            "back": "help_back_detail", "b": "help_back_detail",
-            "exit": "help_back_detail", "quit": "help_back_detail", "cancel": "help_back_detail",
-        }
-        key = detail_map.get(cmd)
-        if key:
-            return twiml_response(_t(sender_phone, key))
-        return twiml_response(_t(sender_phone, "help_unknown", command=help_match.group(1).strip()))
-    if re.match(r"^(?:help|h)\s*$", body_text, re.IGNORECASE):
-        lines = [
-            _t(sender_phone, "help_title"),
-            "",
-            _t(sender_phone, "help_low"),
-            _t(sender_phone, "help_sup"),
-            _t(sender_phone, "help_supa"),
-            _t(sender_phone, "help_list"),
-            _t(sender_phone, "help_listext"),
-            _t(sender_phone, "help_need"),
-            _t(sender_phone, "help_need_fill"),
-            _t(sender_phone, "help_edit"),
-            _t(sender_phone, "help_lows"),
-            _t(sender_phone, "help_lows_fill"),
-            _t(sender_phone, "help_pref"),
-            _t(sender_phone, "help_back"),
-            _t(sender_phone, "help_help"),
-        ]
-        return twiml_response("\n".join(lines))
-
-    # --- Preferences: Pref / P / ה / הגדרות / שפה ---
-    if re.match(r"^(?:pref|p|lang)\s*$", body_text, re.IGNORECASE):
-        _pending_preferences[sender_phone] = "menu"
-        lines = [_t(sender_phone, "pref_title"), "", "  1. " + _t(sender_phone, "pref_lang"), "  2. " + _t(sender_phone, "pref_prep_supplier"), "", _t(sender_phone, "reply_with_number")]
-        return twiml_response("\n".join(lines))
-
-    # --- Pending preferences: menu selection ---
-    if sender_phone in _pending_preferences:
-        state = _pending_preferences[sender_phone]
-        if state == "menu":
-            try:
-                num = int(body_text.strip())
-                if num == 1:
-                    _pending_preferences[sender_phone] = "lang"
-                    langs = get_supported_langs(get_user_lang(sender_phone))
-                    lines = [_t(sender_phone, "lang_supported"), ""]
-                    for i, (code, name) in enumerate(langs, 1):
-                        lines.append(f"  {i}. {name}")
-                    lines.extend(["", _t(sender_phone, "lang_select")])
-                    return twiml_response("\n".join(lines))
-                if num == 2:
-                    suppliers = get_numbered_list()
-                    if not suppliers:
-                        _pending_preferences.pop(sender_phone, None)
-                        return twiml_response(_t(sender_phone, "pref_no_suppliers"))
-                    _pending_preferences[sender_phone] = "prep_supplier"
-                    lines = [_t(sender_phone, "pref_prep_supplier_prompt"), ""]
-                    for i, s in suppliers:
+            num = int(body_text)
+            if num == 1:
+                # Prep → Raw: must choose a supplier other than the prep supplier
+                item = get_item(item_name) or {}
+                current_type = item.get("type") or "Raw"
+                current_sid = item.get("supplier_id")
+                if current_type == "Prep" and current_sid:
+                    all_suppliers = get_numbered_list()
+                    filtered = [s for _, s in all_suppliers if s.get("id") != current_sid]
+                    other_suppliers = [(i, s) for i, s in enumerate(filtered, 1)]
+                    if not other_suppliers:
+                        _pending.pop(sender_phone, None)
+                        return twiml_response(t("edit_prep_to_raw_no_other_supplier", lang))
+                    state.step = "type_raw_supplier"
+                    state.type_raw_suppliers = other_suppliers
+                    lines = [t("edit_prep_to_raw_select_supplier", lang), ""]
+                    for i, s in other_suppliers:
                         lines.append(f"  {i}. {s.get('company_name', '?')}")
-                    lines.extend(["", _t(sender_phone, "reply_with_number")])
+                    lines.extend(["", t("reply_with_number", lang)])
                     return twiml_response("\n".join(lines))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_number_range", max=2))
-        if state == "lang":
-            try:
-                num = int(body_text.strip())
-                langs = get_supported_langs(get_user_lang(sender_phone))
-                if 1 <= num <= len(langs):
-                    code, name = langs[num - 1]
-                    set_user_lang(sender_phone, code)
-                    _pending_preferences.pop(sender_phone, None)
-                    return twiml_response(_t(sender_phone, "lang_set", lang_name=name))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "lang_select"))
-        if state == "prep_supplier":
-            suppliers = get_numbered_list()
-            try:
-                num = int(body_text.strip())
-                if 1 <= num <= len(suppliers):
-                    _, sup = suppliers[num - 1]
-                    sid = sup.get("id", "")
-                    count = set_prep_items_supplier(sid)
-                    _pending_preferences.pop(sender_phone, None)
-                    return twiml_response(_t(sender_phone, "pref_prep_supplier_set", company=sup.get("company_name", "?"), count=count))
-            except ValueError:
-                pass
-            return twiml_response(_t(sender_phone, "reply_number_range", max=len(suppliers)))
-
-
-    # --- Edit: edit item (supplier, type, rename, delete) ---
-    edit_match = re.match(r"^(?:edit|e)\s+(.+)$", body_text, re.IGNORECASE)
-    if edit_match:
-        raw_name = edit_match.group(1).strip()
-        # Strip trailing quantity if present (Edit Milk 3 -> Milk)
-        qty_match = re.search(r"\s+(\d+)\s*$", raw_name)
-        item_name = raw_name[: qty_match.start()].strip() if qty_match else raw_name
-        if not item_name:
-            return twiml_response(_t(sender_phone, "invalid_item"))
-        canonical = get_item_canonical_name(item_name)
-        if not canonical:
-            return twiml_response(_t(sender_phone, "edit_item_not_found", item_name=item_name))
-        _pending_edit[sender_phone] = {"step": "menu", "item_name": canonical}
-        sid = get_item_supplier_id(canonical)
-        itype = get_item_type(canonical)
-        s = get_by_id(sid) if sid else None
-        sup_name = s.get("company_name", "") if s else _t(sender_phone, "list_no_supplier")
-        type_label = _t(sender_phone, "type_prep") if itype == "Prep" else _t(sender_phone, "type_raw")
-        lines = [
-            _t(sender_phone, "edit_menu_header", item_name=canonical, supplier=sup_name, type_label=type_label),
-            "",
-            "  1. " + _t(sender_phone, "edit_change_supplier"),
-            "  2. " + _t(sender_phone, "edit_change_type"),
-            "  3. " + _t(sender_phone, "edit_rename"),
-            "  4. " + _t(sender_phone, "edit_delete"),
-            "",
-            _t(sender_phone, "reply_with_number"),
+                if update_item_type(item_name, "Raw"):
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("edit_type_updated", lang, item_name=item_name, type_label=t("type_raw", lang)))
+            if num == 2:
+                # Raw → Prep: set supplier to default prep supplier (must exist)
+                prep_sid = get_valid_prep_supplier_id(get_by_id)
+                with batch_update():
+                    if prep_sid:
+                        update_item_supplier(item_name, prep_sid)
+                    updated = update_item_type(item_name, "Prep")
+                if updated:
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("edit_type_updated", lang, item_name=item_name, type_label=t("type_prep", lang)))
+        except ValueError:
+            pass
+        return twiml_response(t("reply_type_raw_prep", lang))
+
+    if step == "type_raw_supplier":
+        suppliers = state.type_raw_suppliers
+        try:
+            num = int(body_text)
+            if 1 <= num <= len(suppliers):
+                _, sup = suppliers[num - 1]
+                sid = sup.get("id", "")
+                with batch_update():
+                    updated = update_item_supplier(item_name, sid) and update_item_type(item_name, "Raw")
+                if updated:
+                    _pending.pop(sender_phone, None)
+                    return twiml_response(t("edit_type_updated", lang, item_name=item_name, type_label=t("type_raw", lang)))
+        except ValueError:
+            pass
+        return twiml_response(t("reply_number_range", lang, max=len(suppliers)))
+
+    if step == "rename":
+        new_name = body_text
+        if not new_name:
+            return twiml_response(t("edit_rename_empty", lang))
+        existing = get_item_canonical_name(new_name)
+        if existing is not None and existing != item_name:
+            return twiml_response(t("edit_rename_exists", lang, new_name=new_name))
+        if rename_item(item_name, new_name):
+            _pending.pop(sender_phone, None)
+            return twiml_response(t("edit_renamed", lang, old_name=item_name, new_name=new_name))
+        return twiml_response(t("edit_rename_failed", lang))
+
+    if step == "delete_confirm":
+        if body_lower in _YES_WORDS:
+            if delete_item(item_name):
+                _pending.pop(sender_phone, None)
+                return twiml_response(t("edit_deleted", lang, item_name=item_name))
+        if body_lower in _NO_WORDS:
+            _pending.pop(sender_phone, None)
+            return twiml_response(t("cancelled", lang))
+        return twiml_response(t("edit_delete_reply_yes_no", lang))
+    return None
+
+
+def _handle_lows_fill(
+    state: FillState, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending Lows fill: quantity for current item (empty = 0)."""
+    items_list = state.items
+    idx = state.index
+    try:
+        qty = int(body_text) if body_text else 0
+    except ValueError:
+        qty = 0
+    if qty < 0:
+        qty = 0
+    if qty > 0:
+        it = items_list[idx]
+        state.collected.append((it["name"], qty))
+    idx += 1
+    if idx >= len(items_list):
+        _pending.pop(sender_phone, None)
+        collected = state.collected
+        if not collected:
+            return twiml_response(t("multi_mode_ended_empty", lang))
+        added = _record_quantities(background_tasks, collected, sender_phone)
+        items_str = _bullet_list(added)
+        return twiml_response(t("added_items", lang, count=len(added), items=items_str))
+    state.index = idx
+    next_it = items_list[idx]
+    return twiml_response(t("lows_fill_quantity_prompt", lang, item_name=next_it["name"], num=idx + 1, total=len(items_list)))
+
+
+def _handle_need_fill(
+    state: FillState, body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Pending Need fill: required quantity for current item (empty = 0)."""
+    items_list = state.items
+    idx = state.index
+    try:
+        req_qty = int(body_text) if body_text else 0
+    except ValueError:
+        req_qty = 0
+    if req_qty < 0:
+        req_qty = 0
+    it = items_list[idx]
+    state.collected.append((it["name"], req_qty))
+    idx += 1
+    if idx >= len(items_list):
+        _pending.pop(sender_phone, None)
+        collected = state.collected
+        if not collected:
+            return twiml_response(t("need_fill_ended_empty", lang))
+        updated = [
+            f"{item_name}→{req_qty}" if req_qty else item_name
+            for (item_name, req_qty), ok in zip(collected, set_required_quantities(collected))
+            if ok
         ]
-        return twiml_response("\n".join(lines))
-
-    # --- Need: set required quantity for item, or Need <supplier_regex> for easy fill ---
-    need_match = re.match(r"^(?:need|n)\s+(.+)$", body_text, re.IGNORECASE)
-    if need_match:
-        rest = need_match.group(1).strip()
-        parsed = _parse_item_raw(rest)
-        if parsed:
-            item_name, req_qty = parsed
-            if is_known_item(item_name):
-                set_required_quantity(item_name, req_qty)
-                return twiml_response(_t(sender_phone, "need_updated", item_name=item_name, quantity=req_qty))
-            # Not a known item: try supplier regex for Need fill (Need <supplier_regex>)
-        supplier_pattern = rest
-        if not supplier_pattern:
-            return twiml_response(_t(sender_phone, "invalid_item"))
-        _pending_supplier_selection.pop(sender_phone, None)
-        _pending_type_selection.pop(sender_phone, None)
-        _pending_new_item.pop(sender_phone, None)
+        if not updated:
+            return twiml_response(t("need_fill_ended_empty", lang))
+        items_str = _bullet_list(updated)
+        return twiml_response(t("need_fill_updated", lang, count=len(updated), items=items_str))
+    state.index = idx
+    next_it = items_list[idx]
+    return twiml_response(t("need_fill_quantity_prompt", lang, item_name=next_it["name"], num=idx + 1, total=len(items_list)))
+
+
+def _handle_multi(
+    state: List[Tuple[str, int]], body_text: str, body_lower: str, sender_phone: str, lang: str, background_tasks: BackgroundTasks
+) -> Optional[Response]:
+    """Multi-item mode: existing items only, "!" to finish."""
+    if body_text == "!":
+        _pending.pop(sender_phone, None)
+        if not state:
+            return twiml_response(t("multi_mode_ended_empty", lang))
+        added = _record_quantities(background_tasks, state, sender_phone)
+        items_list = _bullet_list(added)
+        return twiml_response(t("added_items", lang, count=len(added), items=items_list))
+
+    # In multi mode: only existing items
+    parsed = _parse_item_raw(body_text)
+    if parsed:
+        item_name, qty = parsed
+        if not is_known_item(item_name):
+            return twiml_response(
+                t("item_not_in_list_multi", lang, item_name=item_name)
+            )
+        state.append((item_name, qty))
+        part = f"{item_name}×{qty}" if qty > 1 else item_name
+        return twiml_response(t("added_part_send_more", lang, part=part))
+    return twiml_response(t("send_existing_or_finish", lang))
+
+
+def _handle_back(pending: Optional[Tuple[PendingKind, Any]], sender_phone: str, lang: str) -> Response:
+    """Back / B / Exit / Quit / Cancel: go back one step in the pending flow, or cancel it."""
+    kind, state = pending if pending else (None, None)
+    if kind is PendingKind.ADD_SUPPLIER:
+        if state.step == 3:
+            state.step = 2
+            return twiml_response(t("contact_name_prompt", lang))
+        if state.step == 2:
+            state.step = 1
+            return twiml_response(t("company_name_prompt", lang))
+    elif kind is PendingKind.SUPPLIER_SELECTION:
+        item_name, quantity = state
+        _pending[sender_phone] = (PendingKind.TYPE_SELECTION, (item_name, quantity, None))
+        return twiml_response(t("type_select", lang))
+    elif kind is PendingKind.EDIT:
+        if state.step == "type_raw_supplier":
+            state.step = "type"
+            state.type_raw_suppliers = []
+            return twiml_response(t("type_select", lang))
+        if state.step in ("supplier", "type", "rename", "delete_confirm"):
+            state.step = "menu"
+            return twiml_response(_edit_menu(state.item_name, lang))
+    elif kind is None or kind is PendingKind.MULTI:
+        return twiml_response(t("back_no_step", lang))
+    _pending.pop(sender_phone, None)
+    return twiml_response(t("back_cancelled", lang))
+
+
+# Handlers for pending flows, indexed by PendingKind
+_PENDING_HANDLERS: List[Callable[..., Optional[Response]]] = [
+    _handle_new_item,
+    _handle_supplier_selection,
+    _handle_type_selection,
+    _handle_add_supplier,
+    _handle_supplier_details,
+    _handle_preferences,
+    _handle_edit,
+    _handle_lows_fill,
+    _handle_need_fill,
+    _handle_multi,
+]
+
+
+@lru_cache(maxsize=256)  # Shops repeat the same few supplier filters ("Lows Edward", "List Acme")
+def _compile_user_regex(pattern: str) -> "re.Pattern[str]":
+    """Compile a user-supplied supplier filter (case-insensitive). Raises re.error if invalid."""
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _group_items_by_supplier() -> Dict[str, List[Mapping[str, Any]]]:
+    """supplier_id -> items, from one read of the items DB ("" = no supplier)."""
+    by_sid: Dict[str, List[Mapping[str, Any]]] = {}
+    for it in get_all_items():
+        by_sid.setdefault(it.get("supplier_id") or "", []).append(it)
+    return by_sid
+
+
+def _fill_items(pat: "re.Pattern[str]") -> List[dict]:
+    """Items of every supplier whose name matches pat, in supplier order, for the Lows/Need fill flows."""
+    by_sid = _group_items_by_supplier()
+    return [
+        {"name": it.get("name", ""), "supplier_id": it.get("supplier_id"), "type": it.get("type", "Raw")}
+        for s in get_all()
+        if s.get("id") and pat.search(s.get("company_name", "") or "")
+        for it in by_sid.get(s["id"], ())
+    ]
+
+
+def _command_lows(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Lows / S: start multi-item mode (optionally with a first item), or Lows <supplier regex> for easy fill."""
+    if not rest:
+        _pending[sender_phone] = (PendingKind.MULTI, [])
+        return twiml_response(t("multi_mode_start", lang))
+    parsed = _parse_item_raw(rest)
+    if parsed:
+        item_name, qty = parsed
+        if is_known_item(item_name):
+            _pending[sender_phone] = (PendingKind.MULTI, [(item_name, qty)])
+            part = f"{item_name}×{qty}" if qty > 1 else item_name
+            return twiml_response(t("multi_mode_added_part", lang, part=part))
+    # Not a known item: try supplier regex for easy fill (פם <supplier_regex>)
+    supplier_pattern = rest
+    try:
+        pat = _compile_user_regex(supplier_pattern)
+    except re.error:
+        return twiml_response(t("list_invalid_regex", lang, pattern=supplier_pattern))
+    all_items = _fill_items(pat)
+    if not all_items:
+        return twiml_response(t("list_no_match", lang, pattern=supplier_pattern))
+    _pending[sender_phone] = (PendingKind.LOWS_FILL, FillState(all_items))
+    first = all_items[0]
+    return twiml_response(t("lows_fill_quantity_prompt", lang, item_name=first["name"], num=1, total=len(all_items)))
+
+
+# "Help <command>" -> detailed help key
+_HELP_DETAIL_KEYS: Dict[str, str] = {
+    "low": "help_low_detail", "l": "help_low_detail", "sup": "help_sup_detail", "supa": "help_supa_detail",
+    "list": "help_list_detail", "listext": "help_listext_detail", "ext": "help_listext_detail",
+    "need": "help_need_detail", "n": "help_need_detail",
+    "needfill": "help_need_fill_detail", "need_fill": "help_need_fill_detail",
+    "edit": "help_edit_detail", "e": "help_edit_detail",
+    "help": "help_help_detail", "h": "help_help_detail", "lows": "help_lows_detail", "s": "help_lows_detail",
+    "lowsfill": "help_lows_fill_detail", "lows_fill": "help_lows_fill_detail",
+    "lang": "help_lang_detail", "pref": "help_pref_detail", "p": "help_pref_detail",
+    "back": "help_back_detail", "b": "help_back_detail",
+    "exit": "help_back_detail", "quit": "help_back_detail", "cancel": "help_back_detail",
+}
+
+
+def _command_help(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Help / H: show all commands, or detailed help for one command."""
+    if rest:
+        key = _HELP_DETAIL_KEYS.get(rest.lower())
+        if key:
+            return twiml_response(t(key, lang))
+        return twiml_response(t("help_unknown", lang, command=rest))
+    lines = [
+        t("help_title", lang),
+        "",
+        t("help_low", lang),
+        t("help_sup", lang),
+        t("help_supa", lang),
+        t("help_list", lang),
+        t("help_listext", lang),
+        t("help_need", lang),
+        t("help_need_fill", lang),
+        t("help_edit", lang),
+        t("help_lows", lang),
+        t("help_lows_fill", lang),
+        t("help_pref", lang),
+        t("help_back", lang),
+        t("help_help", lang),
+    ]
+    return twiml_response("\n".join(lines))
+
+
+def _command_pref(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Pref / P / Lang: open the preferences menu."""
+    if rest:
+        return None
+    _pending[sender_phone] = (PendingKind.PREFERENCES, "menu")
+    lines = [t("pref_title", lang), "", "  1. " + t("pref_lang", lang), "  2. " + t("pref_prep_supplier", lang), "", t("reply_with_number", lang)]
+    return twiml_response("\n".join(lines))
+
+
+def _command_edit(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Edit / E <item>: open the edit menu (supplier, type, rename, delete)."""
+    if not rest:
+        return None
+    # Strip trailing quantity if present (Edit Milk 3 -> Milk)
+    item_name, _ = _split_trailing_quantity(rest)
+    if not item_name:
+        return twiml_response(t("invalid_item", lang))
+    canonical = get_item_canonical_name(item_name)
+    if not canonical:
+        return twiml_response(t("edit_item_not_found", lang, item_name=item_name))
+    _pending[sender_phone] = (PendingKind.EDIT, EditState("menu", canonical))
+    return twiml_response(_edit_menu(canonical, lang))
+
+
+def _command_need(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Need / N <item> <qty>: set required quantity, or Need <supplier regex> for easy fill."""
+    if not rest:
+        return None
+    parsed = _parse_item_raw(rest)
+    if parsed:
+        item_name, req_qty = parsed
+        if is_known_item(item_name):
+            set_required_quantity(item_name, req_qty)
+            return twiml_response(t("need_updated", lang, item_name=item_name, quantity=req_qty))
+        # Not a known item: try supplier regex for Need fill (Need <supplier_regex>)
+    supplier_pattern = rest
+    try:
+        pat = _compile_user_regex(supplier_pattern)
+    except re.error:
+        return twiml_response(t("list_invalid_regex", lang, pattern=supplier_pattern))
+    all_items = _fill_items(pat)
+    if not all_items:
+        return twiml_response(t("list_no_match", lang, pattern=supplier_pattern))
+    _pending[sender_phone] = (PendingKind.NEED_FILL, FillState(all_items))
+    first = all_items[0]
+    return twiml_response(t("need_fill_quantity_prompt", lang, item_name=first["name"], num=1, total=len(all_items)))
+
+
+def _item_list(supplier_filter: str, lang: str, extended: bool) -> Response:
+    """Items grouped by supplier (no-supplier last), optionally filtered by supplier regex.
+    extended adds the last report date and who updated it (ListExt)."""
+    if supplier_filter:
         try:
-            pat = re.compile(supplier_pattern, re.IGNORECASE)
+            pat = _compile_user_regex(supplier_filter)
         except re.error:
-            return twiml_response(_t(sender_phone, "list_invalid_regex", pattern=supplier_pattern))
-        suppliers = get_all()
-        matching = [s for s in suppliers if pat.search(s.get("company_name", "") or "")]
-        if not matching:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_pattern))
-        all_items: List[dict] = []
-        for s in matching:
-            for it in get_items_by_supplier(s.get("id", "")):
-                all_items.append({
-                    "name": it.get("name", ""),
-                    "supplier_id": it.get("supplier_id"),
-                    "type": it.get("type", "Raw"),
-                })
-        if not all_items:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_pattern))
-        _pending_need_fill[sender_phone] = {"items": all_items, "index": 0, "collected": []}
-        first = all_items[0]
-        return twiml_response(_t(sender_phone, "need_fill_quantity_prompt", item_name=first["name"], num=1, total=len(all_items)))
-
-    # --- ListExt: extended table with last_updated, last_updated_by ---
-    listext_match = re.match(r"^(?:listext|ext)\s+(.+)$", body_text, re.IGNORECASE)
-    if listext_match or re.match(r"^(?:listext|ext)\s*$", body_text, re.IGNORECASE):
-        supplier_filter = listext_match.group(1).strip() if listext_match else None
-        if supplier_filter:
-            try:
-                pat = re.compile(supplier_filter, re.IGNORECASE)
-            except re.error:
-                return twiml_response(_t(sender_phone, "list_invalid_regex", pattern=supplier_filter))
-        items = get_all_items()
-        if not items:
-            return twiml_response(_t(sender_phone, "no_items_yet"))
-        by_supplier: Dict[str, List[tuple]] = {}
-        for i in items:
-            sup_id = i.get("supplier_id") or ""
-            s = get_by_id(sup_id) if sup_id else None
-            sup_name = s.get("company_name", "") if s else _t(sender_phone, "list_no_supplier")
-            if supplier_filter and not pat.search(sup_name):
-                continue
-            key = (sup_name, sup_id)
-            if key not in by_supplier:
-                by_supplier[key] = []
-            by_supplier[key].append(i)
-        if not by_supplier:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_filter or ""))
-        sections = sorted(by_supplier.keys(), key=lambda k: (k[0] == _t(sender_phone, "list_no_supplier"), k[0].lower()))
-        lines = [_t(sender_phone, "listext_header"), ""]
-        for key in sections:
-            sup_name, _sid = key
-            group_items = by_supplier[key]
-            group_items.sort(key=lambda x: (x.get("name", "").lower(),))
-            lines.append(f"{sup_name}:")
-            for i in group_items:
-                itype = i.get("type", "Raw")
-                type_label = _t(sender_phone, "type_prep") if itype == "Prep" else _t(sender_phone, "type_raw")
-                qty = i.get("quantity", 1)
-                req = i.get("required_quantity", 0)
-                seg = f"{qty} / {req}" if req > 0 else f"{qty} / -"
-                qty_display = "\u202a" + seg + "\u202c"
-                last_upd = i.get("last_updated") or "-"
-                last_by = i.get("last_updated_by") or "-"
-                lines.append(f"  • {i.get('name', '?')}  |  {qty_display}  |  {type_label}  |  {last_upd}  |  {last_by}")
-            lines.append("")
-        return twiml_response("\n".join(lines).rstrip())
-
-    # --- List: show items grouped by supplier, optional regex filter ---
-    list_match = re.match(r"^list\s+(.+)$", body_text, re.IGNORECASE)
-    if list_match or re.match(r"^list\s*$", body_text, re.IGNORECASE):
-        supplier_filter = list_match.group(1).strip() if list_match else None
-        if supplier_filter:
-            try:
-                pat = re.compile(supplier_filter, re.IGNORECASE)
-            except re.error:
-                return twiml_response(_t(sender_phone, "list_invalid_regex", pattern=supplier_filter))
-        items = get_all_items()
-        if not items:
-            return twiml_response(_t(sender_phone, "no_items_yet"))
-        by_supplier: Dict[str, List[tuple]] = {}
-        for i in items:
-            sup_id = i.get("supplier_id") or ""
-            s = get_by_id(sup_id) if sup_id else None
-            sup_name = s.get("company_name", "") if s else _t(sender_phone, "list_no_supplier")
-            if supplier_filter and not pat.search(sup_name):
-                continue
-            key = (sup_name, sup_id)
-            if key not in by_supplier:
-                by_supplier[key] = []
-            by_supplier[key].append(i)
-        if not by_supplier:
-            return twiml_response(_t(sender_phone, "list_no_match", pattern=supplier_filter or ""))
-        # Sort supplier sections by name, no-supplier last
-        sections = sorted(by_supplier.keys(), key=lambda k: (k[0] == _t(sender_phone, "list_no_supplier"), k[0].lower()))
-        lines = [_t(sender_phone, "items_header"), ""]
-        for key in sections:
-            sup_name, _sid = key
-            group_items = by_supplier[key]
-            group_items.sort(key=lambda x: (x.get("name", "").lower(),))
-            lines.append(f"{sup_name}:")
-            for i in group_items:
-                itype = i.get("type", "Raw")
-                type_label = _t(sender_phone, "type_prep") if itype == "Prep" else _t(sender_phone, "type_raw")
-                qty = i.get("quantity", 1)
-                req = i.get("required_quantity", 0)
-                seg = f"{qty} / {req}" if req > 0 else f"{qty} / -"
-                qty_display = "\u202a" + seg + "\u202c"
-                lines.append(f"  • {i.get('name', '?')}  |  {qty_display}  |  {type_label}")
-            lines.append("")
-        return twiml_response("\n".join(lines).rstrip())
-
-    if re.match(r"^sup\s*$", body_text, re.IGNORECASE):
-        suppliers = get_numbered_list()
-        if not suppliers:
-            return twiml_response(_t(sender_phone, "no_suppliers_yet"))
-        _pending_supplier_details[sender_phone] = True
-        lines = [_t(sender_phone, "suppliers_header"), ""]
-        for i, s in suppliers:
-            lines.append(f"{i}. {s.get('company_name', '?')}")
-        lines.extend(["", _t(sender_phone, "suppliers_select_number")])
-        return twiml_response("\n".join(lines))
-
-    if re.match(r"^supa\s*$", body_text, re.IGNORECASE):
-        _pending_add_supplier[sender_phone] = {"step": 1}
-        return twiml_response(_t(sender_phone, "company_name_prompt"))
+            return twiml_response(t("list_invalid_regex", lang, pattern=supplier_filter))
+    items = get_all_items()
+    if not items:
+        return twiml_response(t("no_items_yet", lang))
+    # Labels repeated on every line, translated once
+    label_prep = t("type_prep", lang)
+    label_raw = t("type_raw", lang)
+    label_no_supplier = t("list_no_supplier", lang)
+    # One read of the suppliers DB instead of a get_by_id per item
+    supplier_names = {s.get("id"): s.get("company_name", "") for s in get_all()}
+    by_supplier: Dict[Tuple[str, str], List[Mapping[str, Any]]] = {}
+    for i in items:
+        sup_id = i.get("supplier_id") or ""
+        sup_name = supplier_names.get(sup_id) if sup_id else None
+        if sup_name is None:
+            sup_name = label_no_supplier
+        if supplier_filter and not pat.search(sup_name):
+            continue
+        by_supplier.setdefault((sup_name, sup_id), []).append(i)
+    if not by_supplier:
+        return twiml_response(t("list_no_match", lang, pattern=supplier_filter))
+    # Sort supplier sections by name, no-supplier last
+    sections = sorted(by_supplier, key=lambda k: (k[0] == label_no_supplier, k[0].lower()))
+    blocks = [t("listext_header" if extended else "items_header", lang)]
+    for key in sections:
+        group_items = sorted(by_supplier[key], key=lambda x: x.get("name", "").lower())
+        lines = [f"{key[0]}:"]
+        for i in group_items:
+            type_label = label_prep if i.get("type", "Raw") == "Prep" else label_raw
+            qty = i.get("quantity", 1)
+            req = i.get("required_quantity", 0)
+            seg = f"{qty} / {req}" if req > 0 else f"{qty} / -"
+            line = f"  • {i.get('name', '?')}  |  \u202a{seg}\u202c  |  {type_label}"
+            if extended:
+                line += f"  |  {i.get('last_updated') or '-'}  |  {i.get('last_updated_by') or '-'}"
+            lines.append(line)
+        blocks.append("\n".join(lines))
+    return twiml_response("\n\n".join(blocks))
+
+
+def _command_listext(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """ListExt / Ext [supplier regex]: extended table with last_updated, last_updated_by."""
+    return _item_list(rest, lang, extended=True)
+
+
+def _command_list(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """List [supplier regex]: show items grouped by supplier."""
+    return _item_list(rest, lang, extended=False)
+
+
+def _command_sup(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Sup: numbered supplier list; reply with a number for details."""
+    if rest:
+        return None
+    suppliers = get_numbered_list()
+    if not suppliers:
+        return twiml_response(t("no_suppliers_yet", lang))
+    _pending[sender_phone] = (PendingKind.SUPPLIER_DETAILS, True)
+    lines = [t("suppliers_header", lang), ""]
+    for i, s in suppliers:
+        lines.append(f"{i}. {s.get('company_name', '?')}")
+    lines.extend(["", t("suppliers_select_number", lang)])
+    return twiml_response("\n".join(lines))
+
+
+def _command_supa(rest: str, sender_phone: str, lang: str) -> Optional[Response]:
+    """Supa: start the add-supplier flow."""
+    if rest:
+        return None
+    _pending[sender_phone] = (PendingKind.ADD_SUPPLIER, SupplierDraft())
+    return twiml_response(t("company_name_prompt", lang))
+
+
+# Standalone command chars/words that are never item names. ASCII entries are lowercase
+# and Hebrew has no case, so one lookup of the lowercased body covers both.
+_RESERVED_WORDS = frozenset({
+    "low", "l", "sup", "supa", "list", "listext", "ext", "need", "n", "edit", "e", "help", "h", "lang", "lows", "s", "pref", "p", "back", "b", "exit", "quit", "cancel",
+    "yes", "y", "ye", "no",
+    "פ", "ס", "סח", "מ", "ממ", "ע", "צ", "ער", "פם", "ם", "שפה", "הגדרות", "ה", "חזור", "ח", "בטל", "צא", "צריך", "ערוך", "פריט", "ספק", "מלאי", "מלאימורחב", "עזרה", "כן", "כ", "לא", "ל",
+})
+
+# Commands keyed on the lowercased first word (Hebrew commands are normalized to these first).
+# A handler returns None when the rest of the message doesn't fit it (e.g. "Sup Milk"),
+# and the message falls through to single-item mode.
+_COMMANDS: Dict[str, Callable[[str, str, str], Optional[Response]]] = {
+    "lows": _command_lows, "s": _command_lows,
+    "help": _command_help, "h": _command_help,
+    "pref": _command_pref, "p": _command_pref, "lang": _command_pref,
+    "edit": _command_edit, "e": _command_edit,
+    "need": _command_need, "n": _command_need,
+    "listext": _command_listext, "ext": _command_listext,
+    "list": _command_list,
+    "sup": _command_sup,
+    "supa": _command_supa,
+}
+# Commands that take over from a pending Preferences reply
+_COMMANDS_OVER_PREFERENCES = frozenset({_command_lows, _command_help, _command_pref})
+
+
+@app.post("/whatsapp")
+async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks) -> Response:
+    """
+    Twilio webhook for incoming WhatsApp messages.
+
+    Supports:
+    - Single item: "Low Milk", "Milk 2" (default = Low), "!" reserved
+    - Pending new-item: reply yes/no to add new item
+    - Multi-item mode: "Lows" then items (existing only), "!" to finish
+    """
+    # Twilio posts a small urlencoded form; parse it directly instead of Starlette's form parser
+    raw_body = await request.body()
+    form_dict = dict(parse_qsl(raw_body.decode("latin-1"), keep_blank_values=True))
+
+    # Validation is skipped when TWILIO_AUTH_TOKEN is not configured (e.g. local dev)
+    if _twilio_validator is not None and not _validate_twilio_request(request, form_dict):
+        return Response(status_code=403, content="Invalid signature")
+
+    body_text = form_dict.get("Body", "").strip()
+    sender_phone = form_dict.get("From") or UNKNOWN_SENDER
+
+    # User's language, looked up once per request (updated below if the user changes it)
+    lang = get_user_lang(sender_phone)
+
+    # Normalize Hebrew commands to English when in Hebrew mode
+    body_text = _normalize_command(body_text, lang)
+    # body_text stays stripped from here on; lowercase it once for command matching
+    body_lower = body_text.lower()
+
+    pending = _pending.get(sender_phone)
+    kind = pending[0] if pending else None
+
+    # --- Reserved: "!" is never an item (cancels any pending flow; finishes multi-item mode) ---
+    if body_text == "!":
+        if kind is None:
+            return twiml_response(t("exclamation_reserved", lang))
+        if kind is not PendingKind.MULTI:
+            _pending.pop(sender_phone, None)
+            return twiml_response(t("cancelled", lang))
+
+    # --- Back: go back one step in any pending state ---
+    if body_lower in _BACK_COMMANDS:
+        return _handle_back(pending, sender_phone, lang)
+
+    # --- Pending flows; Preferences is handled below, after the Lows/Help/Pref commands ---
+    if kind is not None and kind is not PendingKind.PREFERENCES:
+        response = _PENDING_HANDLERS[kind](pending[1], body_text, body_lower, sender_phone, lang, background_tasks)
+        if response is not None:
+            return response
+
+    # --- Commands, dispatched on the first word; Lows/Help/Pref take over from a pending Preferences reply ---
+    parts = body_text.split(None, 1)
+    command = _COMMANDS.get(parts[0].lower()) if parts else None
+    rest = parts[1].strip() if len(parts) > 1 else ""
+
+    # Pref takes over only on its own ("P 2" is a menu reply, not a command)
+    if kind is PendingKind.PREFERENCES and (
+        command not in _COMMANDS_OVER_PREFERENCES or (command is _command_pref and rest)
+    ):
+        response = _handle_preferences(pending[1], body_text, body_lower, sender_phone, lang, background_tasks)
+        if response is not None:
+            return response
+
+    if command is not None:
+        response = command(rest, sender_phone, lang)
+        if response is not None:
+            return response
 
     # --- Reserved words: standalone command chars/words are not items ---
-    _RESERVED = frozenset({
-        "low", "l", "sup", "supa", "list", "listext", "ext", "need", "n", "edit", "e", "help", "h", "lang", "lows", "s", "pref", "p", "back", "b", "exit", "quit", "cancel",
-        "yes", "y", "ye", "no",
-        "פ", "ס", "סח", "מ", "ממ", "ע", "צ", "ער", "פם", "ם", "שפה", "הגדרות", "ה", "חזור", "ח", "בטל", "צא", "צריך", "ערוך", "פריט", "ספק", "מלאי", "מלאימורחב", "עזרה", "כן", "כ", "לא", "ל",
-    })
-    if body_text.strip().lower() in {w.lower() for w in _RESERVED if w.isascii()} or body_text.strip() in _RESERVED:
-        return twiml_response(_t(sender_phone, "reserved_word"))
+    if body_lower in _RESERVED_WORDS:
+        return twiml_response(t("reserved_word", lang))
 
     # --- Single-item mode ---
     item_name, quantity = parse_item_and_quantity(body_text)
-    if item_name == "Unknown Item" or not item_name:
-        return twiml_response(_t(sender_phone, "invalid_item"))
+    if item_name == UNKNOWN_ITEM or not item_name:
+        return twiml_response(t("invalid_item", lang))
 
     has_low = _has_explicit_low(body_text)
 
-    if is_known_item(item_name):
-        sid = get_item_supplier_id(item_name)
-        itype = get_item_type(item_name)
-        reply = _do_append_and_confirm(item_name, quantity, sender_phone, sid, itype)
+    item = get_item(item_name)
+    if item is not None:
+        sid = item.get("supplier_id")
+        itype = item.get("type") or "Raw"
+        reply = _do_append_and_confirm(background_tasks, item_name, quantity, sender_phone, lang, sid, itype)
         return twiml_response(reply)
 
     # New item: type first, then supplier only for Raw
     if has_low:
-        _pending_type_selection[sender_phone] = (item_name, quantity, None)
-        return twiml_response(_t(sender_phone, "type_select"))
+        _pending[sender_phone] = (PendingKind.TYPE_SELECTION, (item_name, quantity, None))
+        return twiml_response(t("type_select", lang))
 
-    _pending_new_item[sender_phone] = (item_name, quantity)
-    return twiml_response(_t(sender_phone, "add_new_item_confirm", item_name=item_name))
+    _pending[sender_phone] = (PendingKind.NEW_ITEM, (item_name, quantity))
+    return twiml_response(t("add_new_item_confirm", lang, item_name=item_name))
 
 
 if __name__ == "__main__":
     import uvicorn
 
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # "auto" picks uvloop + httptools when installed (uvicorn[standard]). Conversation state lives in process memory,
+    # so keep WEB_CONCURRENCY at 1 unless sessions are moved to a shared store.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="auto",
+        http="auto",
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+    )
@@ -4,9 +4,10 @@ Internationalization (i18n) for Shop Assistant bot.
 Loads translations from locale/*.json. User language is stored per phone number.
 """
 
-import json
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+
+from services.json_store import read_json
 
 LOCALE_DIR = Path(__file__).resolve().parent.parent / "locale"
 SUPPORTED_LANGS = ["en", "he"]
@@ -14,6 +15,8 @@ DEFAULT_LANG = "he"
 
 # Loaded translations: {lang_code: {key: value}}
 _translations: Dict[str, Dict[str, str]] = {}
+# Same strings keyed by (lang_code, key), so t() resolves a message with one lookup
+_flat: Dict[Tuple[str, str], str] = {}
 
 # User language: phone -> lang_code
 _user_lang: Dict[str, str] = {}
@@ -25,16 +28,17 @@ def _load_locale(lang: str) -> Dict[str, str]:
     if not path.exists():
         return {}
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        return read_json(path)
+    except (ValueError, OSError):
         return {}
 
 
 def _get_translations(lang: str) -> Dict[str, str]:
     """Get translations for a language, loading if needed."""
     if lang not in _translations:
-        _translations[lang] = _load_locale(lang)
+        trans = _load_locale(lang)
+        _translations[lang] = trans
+        _flat.update(((lang, k), v) for k, v in trans.items())
     return _translations[lang]
 
 
@@ -53,8 +57,7 @@ def t(key: str, lang: Optional[str] = None, **kwargs) -> str:
     code = lang or DEFAULT_LANG
     if code not in SUPPORTED_LANGS:
         code = DEFAULT_LANG
-    trans = _get_translations(code)
-    text = trans.get(key, key)
+    text = _flat.get((code, key), key)
     if kwargs:
         try:
             text = text.format(**kwargs)
@@ -63,6 +66,11 @@ def t(key: str, lang: Optional[str] = None, **kwargs) -> str:
     return text
 
 
+# Supported locales are small and fixed: load them at import rather than on first use
+for _lang in SUPPORTED_LANGS:
+    _get_translations(_lang)
+
+
 def get_user_lang(phone: str) -> str:
     """Get language for a user (phone). Defaults to he."""
     return _user_lang.get(phone, DEFAULT_LANG)
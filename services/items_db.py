@@ -5,25 +5,65 @@ Type: "Raw" (raw product) or "Prep" (prepared item).
 Tracks last_updated and last_updated_by when quantity is updated via Low/Lows.
 """
 
-import json
 import os
+import re
+from bisect import insort
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from services.json_store import read_json, write_json
+from services.suppliers_db import get_all as get_all_suppliers
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 ITEMS_FILE = Path(os.environ.get("ITEMS_DB_PATH", DATA_DIR / "items.json"))
-PREP_CONFIG_FILE = DATA_DIR / "prep_config.json"
+PREP_CONFIG_FILE = Path(os.environ.get("PREP_CONFIG_PATH", DATA_DIR / "prep_config.json"))
 
 VALID_TYPES = ("Raw", "Prep")
 
+_RE_NON_DIGITS = re.compile(r"\D+")
+
+# Parsed items reused while the file is unchanged: (st_mtime_ns, st_size, items, name key -> position)
+_cache: Optional[Tuple[int, int, List[dict], Dict[str, int]]] = None
+
+# Inside batch_update(): nesting depth, and the items saved but not yet written (items, positions)
+_batch_depth = 0
+_batch_pending: Optional[Tuple[List[dict], Dict[str, int]]] = None
+
+# Read-only views of the cached items, rebuilt when the cached list changes: (items list, views)
+_views: Optional[Tuple[List[dict], Tuple[Mapping[str, Any], ...]]] = None
+
 
 def _ensure_data_dir() -> None:
     ITEMS_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 
+_REQUIRED_FIELDS = frozenset({"name", "supplier_id", "type", "quantity", "required_quantity"})
+_ALLOWED_FIELDS = _REQUIRED_FIELDS | {"last_updated", "last_updated_by"}
+
+
+def _is_normalized(item: dict) -> bool:
+    """True if _normalize_item would return an equal dict (the common case for files the bot wrote)."""
+    keys = item.keys()
+    if not (keys >= _REQUIRED_FIELDS and keys <= _ALLOWED_FIELDS):
+        return False
+    name, qty, req = item["name"], item["quantity"], item["required_quantity"]
+    return (
+        isinstance(name, str) and name == name.strip()
+        and isinstance(qty, int) and qty >= 0
+        and isinstance(req, int) and req >= 0
+        and item["type"] in VALID_TYPES
+        and item.get("last_updated", True) and item.get("last_updated_by", True)
+    )
+
+
 def _normalize_item(item: dict) -> dict:
-    """Ensure item has name, supplier_id, type, quantity, required_quantity, last_updated, last_updated_by."""
+    """Ensure item has name, supplier_id, type, quantity, required_quantity, last_updated, last_updated_by.
+    Already-normalized items are returned as is, not copied."""
+    if _is_normalized(item):
+        return item
     name = item.get("name") or ""
     if isinstance(item.get("name"), str):
         name = item["name"].strip()
@@ -47,14 +87,10 @@ def _normalize_item(item: dict) -> dict:
     return result
 
 
-def _load_raw() -> List[dict]:
-    """Load items as list of {name, supplier_id, type}."""
-    _ensure_data_dir()
-    if not ITEMS_FILE.exists():
-        return []
+def _read_file() -> List[dict]:
+    """Parse and normalize the items file, sorted by name (insort relies on this order)."""
     try:
-        with open(ITEMS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(ITEMS_FILE)
         raw = data.get("items", [])
         result = []
         for item in raw:
@@ -62,16 +98,119 @@ def _load_raw() -> List[dict]:
                 result.append(_normalize_item(item))
             else:
                 result.append({"name": str(item).strip(), "supplier_id": None, "type": "Raw", "quantity": 1, "required_quantity": 0})
+        result.sort(key=_sort_key)  # once per file version; hand-edited files may be unsorted
         return result
-    except (json.JSONDecodeError, IOError):
+    except (ValueError, OSError):
         return []
 
 
+def _positions_by_name(items: List[dict]) -> Dict[str, int]:
+    """Map name key -> position in items (first match wins, like the linear lookups)."""
+    positions: Dict[str, int] = {}
+    for idx, item in enumerate(items):
+        positions.setdefault(_name_key(item.get("name", "")), idx)
+    return positions
+
+
+def _load_cached() -> Tuple[List[dict], Dict[str, int]]:
+    """Parsed items and their name index, re-read only when the file's mtime or size changed.
+    Callers must not mutate."""
+    global _cache
+    if _batch_pending is not None:
+        return _batch_pending
+    _ensure_data_dir()
+    try:
+        st = ITEMS_FILE.stat()
+    except FileNotFoundError:
+        _cache = None
+        return [], {}
+    if _cache is None or _cache[0] != st.st_mtime_ns or _cache[1] != st.st_size:
+        items = _read_file()
+        _cache = (st.st_mtime_ns, st.st_size, items, _positions_by_name(items))
+    return _cache[2], _cache[3]
+
+
+def _find_cached(item_name: str) -> Optional[dict]:
+    """The cached item for a name (case-insensitive), or None. Callers must not mutate."""
+    key = _name_key(item_name)
+    if not key:
+        return None
+    items, positions = _load_cached()
+    idx = positions.get(key)
+    return items[idx] if idx is not None else None
+
+
+def _load_for_update(item_name: str) -> Tuple[List[dict], Optional[int]]:
+    """Mutable copy of the items plus the position of item_name in it (None if absent)."""
+    items, positions = _load_cached()
+    return [dict(i) for i in items], positions.get(_name_key(item_name))
+
+
+def _load_indexed() -> Tuple[List[dict], Dict[str, dict]]:
+    """Mutable copy of the items plus name key -> copied item, reusing the cached name index."""
+    items, positions = _load_cached()
+    copies = [dict(i) for i in items]
+    return copies, {key: copies[idx] for key, idx in positions.items()}
+
+
+def _load_views() -> Tuple[Mapping[str, Any], ...]:
+    """Read-only views of the cached items, shared by readers without copying."""
+    global _views
+    items = _load_cached()[0]
+    if _views is None or _views[0] is not items:
+        _views = (items, tuple(MappingProxyType(i) for i in items))
+    return _views[1]
+
+
+def _invalidate_cache() -> None:
+    """Drop the parsed items (for tests that replace the file underneath)."""
+    global _cache
+    _cache = None
+
+
+def _load_raw() -> List[dict]:
+    """Load items as list of {name, supplier_id, type} (copies: safe to mutate, then _save_raw)."""
+    return [dict(i) for i in _load_cached()[0]]
+
+
 def _save_raw(items: List[dict]) -> None:
-    """Save items."""
+    """Save items, and keep them as the parsed cache for the file just written.
+    Items are normalized once on load, and the updaters keep them that way, so they are saved as is.
+    Inside batch_update() the write is deferred to the end of the block."""
+    global _cache, _batch_pending
+    if _batch_depth:
+        _batch_pending = (items, _positions_by_name(items))
+        return
     _ensure_data_dir()
-    with open(ITEMS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"items": items}, f, indent=2)
+    write_json(ITEMS_FILE, {"items": items})
+    st = ITEMS_FILE.stat()
+    _cache = (st.st_mtime_ns, st.st_size, items, _positions_by_name(items))
+
+
+@contextmanager
+def batch_update() -> Iterator[None]:
+    """Group several updates into one items file write at the end of the block.
+    Reads inside the block see the pending changes; nested blocks join the outermost one.
+    If the block raises, the pending changes are dropped and the file is left as it was."""
+    global _batch_depth, _batch_pending
+    _batch_depth += 1
+    try:
+        yield
+    except BaseException:
+        _batch_depth -= 1
+        if _batch_depth == 0:
+            _batch_pending = None
+        raise
+    _batch_depth -= 1
+    if _batch_depth == 0 and _batch_pending is not None:
+        items = _batch_pending[0]
+        _batch_pending = None
+        _save_raw(items)
+
+
+def _sort_key(item: dict) -> str:
+    """Order of the items list (by name, case-insensitive)."""
+    return item.get("name", "").lower()
 
 
 def _name_key(name: str) -> str:
@@ -80,54 +219,45 @@ def _name_key(name: str) -> str:
 
 def is_known_item(item_name: str) -> bool:
     """Check if item exists in the database (case-insensitive)."""
-    key = _name_key(item_name)
-    if not key:
-        return False
-    for item in _load_raw():
-        n = item.get("name", "")
-        if _name_key(n) == key:
-            return True
-    return False
+    return _find_cached(item_name) is not None
 
 
 def _format_phone_display(phone: Optional[str]) -> str:
     """Return last 4 digits for display, or empty string."""
     if not phone:
         return ""
-    digits = "".join(c for c in str(phone) if c.isdigit())
+    digits = _RE_NON_DIGITS.sub("", str(phone))
     if len(digits) >= 4:
         return ".." + digits[-4:]
     return digits if digits else ""
 
 
-def add_item(
+def _add_to_items(
+    items: List[dict],
     item_name: str,
-    supplier_id: Optional[str] = None,
-    item_type: str = "Raw",
-    quantity: int = 1,
-    updated_by: Optional[str] = None,
+    supplier_id: Optional[str],
+    item_type: str,
+    quantity: int,
+    updated_by: Optional[str],
+    now: str,
+    index: Dict[str, dict],
 ) -> None:
-    """Add or update item in the database. Quantity is added to existing total.
-    updated_by: phone/sender for last_updated_by when quantity changes via Low/Lows."""
-    if not item_name or not item_name.strip():
-        return
+    """Add or update one item in a sorted loaded list (in place).
+    index: name-key -> item map for the same list, kept up to date."""
     if item_type not in VALID_TYPES:
         item_type = "Raw"
     if not isinstance(quantity, int) or quantity < 1:
         quantity = 1
-    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    items = _load_raw()
     key = _name_key(item_name)
-    for item in items:
-        if _name_key(item.get("name", "")) == key:
-            item["supplier_id"] = supplier_id
-            item["type"] = item_type
-            item["quantity"] = item.get("quantity", 1) + quantity
-            if updated_by:
-                item["last_updated"] = now
-                item["last_updated_by"] = _format_phone_display(updated_by)
-            _save_raw(items)
-            return
+    existing = index.get(key)
+    if existing is not None:
+        existing["supplier_id"] = supplier_id
+        existing["type"] = item_type
+        existing["quantity"] = existing.get("quantity", 1) + quantity
+        if updated_by:
+            existing["last_updated"] = now
+            existing["last_updated_by"] = _format_phone_display(updated_by)
+        return
     new_item = {
         "name": item_name.strip().title(),
         "supplier_id": supplier_id,
@@ -138,39 +268,72 @@ def add_item(
     if updated_by:
         new_item["last_updated"] = now
         new_item["last_updated_by"] = _format_phone_display(updated_by)
-    items.append(new_item)
-    items.sort(key=lambda x: (x.get("name", "").lower(),))
+    insort(items, new_item, key=_sort_key)
+    index[key] = new_item
+
+
+def add_item(
+    item_name: str,
+    supplier_id: Optional[str] = None,
+    item_type: str = "Raw",
+    quantity: int = 1,
+    updated_by: Optional[str] = None,
+) -> None:
+    """Add or update item in the database. Quantity is added to existing total.
+    updated_by: phone/sender for last_updated_by when quantity changes via Low/Lows."""
+    if not item_name or not item_name.strip():
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    items, idx = _load_for_update(item_name)
+    index = {_name_key(item_name): items[idx]} if idx is not None else {}
+    _add_to_items(items, item_name, supplier_id, item_type, quantity, updated_by, now, index)
+    _save_raw(items)
+
+
+def add_items(
+    entries: List[Tuple[str, Optional[str], str, int]],
+    updated_by: Optional[str] = None,
+) -> None:
+    """Like add_item for many (item_name, supplier_id, item_type, quantity) entries, with one load and one save."""
+    entries = [e for e in entries if e[0] and e[0].strip()]
+    if not entries:
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    items, index = _load_indexed()
+    for item_name, supplier_id, item_type, quantity in entries:
+        _add_to_items(items, item_name, supplier_id, item_type, quantity, updated_by, now, index)
     _save_raw(items)
 
 
 def get_item_supplier_id(item_name: str) -> Optional[str]:
     """Get supplier_id for an item, or None."""
-    key = _name_key(item_name)
-    for item in _load_raw():
-        if _name_key(item.get("name", "")) == key:
-            return item.get("supplier_id")
-    return None
+    item = _find_cached(item_name)
+    return item.get("supplier_id") if item is not None else None
 
 
 def get_item_type(item_name: str) -> str:
     """Get type for an item, default Raw."""
-    key = _name_key(item_name)
-    for item in _load_raw():
-        if _name_key(item.get("name", "")) == key:
-            return item.get("type") or "Raw"
-    return "Raw"
+    item = _find_cached(item_name)
+    return (item.get("type") or "Raw") if item is not None else "Raw"
+
+
+def get_item(item_name: str) -> Optional[dict]:
+    """Return the stored item (case-insensitive match), or None. One read for supplier + type + name."""
+    item = _find_cached(item_name)
+    return dict(item) if item is not None else None
 
 
-def get_all_items() -> List[dict]:
-    """Return all items: [{name, supplier_id, type, quantity, required_quantity}, ...]."""
-    return _load_raw()
+def get_all_items() -> Tuple[Mapping[str, Any], ...]:
+    """Return all items: ({name, supplier_id, type, quantity, required_quantity}, ...).
+    Read-only views of the cache; change items through add_item / update_* instead."""
+    return _load_views()
 
 
-def get_items_by_supplier(supplier_id: str) -> List[dict]:
-    """Return items that have this supplier_id."""
+def get_items_by_supplier(supplier_id: str) -> Tuple[Mapping[str, Any], ...]:
+    """Return items that have this supplier_id (read-only views, like get_all_items)."""
     if not supplier_id:
-        return []
-    return [i for i in _load_raw() if i.get("supplier_id") == supplier_id]
+        return ()
+    return tuple(i for i in _load_views() if i.get("supplier_id") == supplier_id)
 
 
 def get_prep_supplier_id() -> Optional[str]:
@@ -178,15 +341,14 @@ def get_prep_supplier_id() -> Optional[str]:
     _ensure_data_dir()
     if PREP_CONFIG_FILE.exists():
         try:
-            with open(PREP_CONFIG_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = read_json(PREP_CONFIG_FILE)
             sid = data.get("prep_supplier_id")
             if sid:
                 return sid
-        except (json.JSONDecodeError, IOError):
+        except (ValueError, OSError):
             pass
     # Fallback: use supplier from first Prep item
-    for item in _load_raw():
+    for item in _load_cached()[0]:
         if item.get("type") == "Prep" and item.get("supplier_id"):
             return item["supplier_id"]
     return None
@@ -198,8 +360,7 @@ def get_valid_prep_supplier_id(validate_fn) -> Optional[str]:
     if sid and validate_fn(sid):
         return sid
     # Config has stale/invalid id - try to find "הכנות" by name and fix config
-    from services.suppliers_db import get_all
-    for s in get_all():
+    for s in get_all_suppliers():
         name = (s.get("company_name") or "").strip()
         if "הכנות" in name or "prep" in name.lower():
             set_prep_supplier_id(s.get("id"))
@@ -209,9 +370,8 @@ def get_valid_prep_supplier_id(validate_fn) -> Optional[str]:
 
 def set_prep_supplier_id(supplier_id: Optional[str]) -> None:
     """Save the default prep supplier id."""
-    _ensure_data_dir()
-    with open(PREP_CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump({"prep_supplier_id": supplier_id}, f, indent=2)
+    PREP_CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    write_json(PREP_CONFIG_FILE, {"prep_supplier_id": supplier_id})
 
 
 def set_prep_items_supplier(supplier_id: Optional[str]) -> int:
@@ -234,51 +394,56 @@ def set_required_quantity(item_name: str, required_quantity: int) -> bool:
         return False
     if not isinstance(required_quantity, int) or required_quantity < 0:
         return False
-    items = _load_raw()
-    key = _name_key(item_name)
-    for item in items:
-        if _name_key(item.get("name", "")) == key:
+    items, idx = _load_for_update(item_name)
+    if idx is None:
+        return False
+    items[idx]["required_quantity"] = required_quantity
+    _save_raw(items)
+    return True
+
+
+def set_required_quantities(entries: List[Tuple[str, int]]) -> List[bool]:
+    """Like set_required_quantity for many (item_name, required_quantity) entries, with one load and one save.
+    Returns, per entry, whether it was applied."""
+    items, index = _load_indexed()
+    applied: List[bool] = []
+    for item_name, required_quantity in entries:
+        item = index.get(_name_key(item_name)) if item_name and item_name.strip() else None
+        ok = item is not None and isinstance(required_quantity, int) and required_quantity >= 0
+        if ok:
             item["required_quantity"] = required_quantity
-            _save_raw(items)
-            return True
-    return False
+        applied.append(ok)
+    if any(applied):
+        _save_raw(items)
+    return applied
 
 
 def get_item_canonical_name(item_name: str) -> Optional[str]:
     """Return the stored name for an item (case-insensitive match), or None."""
-    key = _name_key(item_name)
-    if not key:
-        return None
-    for item in _load_raw():
-        if _name_key(item.get("name", "")) == key:
-            return item.get("name", "")
-    return None
+    item = _find_cached(item_name)
+    return item.get("name", "") if item is not None else None
 
 
 def update_item_supplier(item_name: str, supplier_id: Optional[str]) -> bool:
     """Update supplier for an item. Returns True if item exists."""
-    items = _load_raw()
-    key = _name_key(item_name)
-    for item in items:
-        if _name_key(item.get("name", "")) == key:
-            item["supplier_id"] = supplier_id
-            _save_raw(items)
-            return True
-    return False
+    items, idx = _load_for_update(item_name)
+    if idx is None:
+        return False
+    items[idx]["supplier_id"] = supplier_id
+    _save_raw(items)
+    return True
 
 
 def update_item_type(item_name: str, item_type: str) -> bool:
     """Update type for an item. Returns True if item exists."""
     if item_type not in VALID_TYPES:
         return False
-    items = _load_raw()
-    key = _name_key(item_name)
-    for item in items:
-        if _name_key(item.get("name", "")) == key:
-            item["type"] = item_type
-            _save_raw(items)
-            return True
-    return False
+    items, idx = _load_for_update(item_name)
+    if idx is None:
+        return False
+    items[idx]["type"] = item_type
+    _save_raw(items)
+    return True
 
 
 def rename_item(old_name: str, new_name: str) -> bool:
@@ -287,23 +452,21 @@ def rename_item(old_name: str, new_name: str) -> bool:
         return False
     if is_known_item(new_name) and _name_key(new_name) != _name_key(old_name):
         return False
-    items = _load_raw()
-    key = _name_key(old_name)
-    for item in items:
-        if _name_key(item.get("name", "")) == key:
-            item["name"] = new_name.strip()
-            items.sort(key=lambda x: (x.get("name", "").lower(),))
-            _save_raw(items)
-            return True
-    return False
+    items, idx = _load_for_update(old_name)
+    if idx is None:
+        return False
+    item = items.pop(idx)
+    item["name"] = new_name.strip()
+    insort(items, item, key=_sort_key)
+    _save_raw(items)
+    return True
 
 
 def delete_item(item_name: str) -> bool:
     """Delete an item. Returns True if deleted."""
-    items = _load_raw()
-    key = _name_key(item_name)
-    new_items = [i for i in items if _name_key(i.get("name", "")) != key]
-    if len(new_items) < len(items):
-        _save_raw(new_items)
-        return True
-    return False
+    items, idx = _load_for_update(item_name)
+    if idx is None:
+        return False
+    items.pop(idx)
+    _save_raw(items)
+    return True
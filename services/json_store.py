@@ -0,0 +1,49 @@
+"""
+JSON file helpers shared by the items and suppliers databases.
+
+Uses orjson when it is installed (several times faster to parse and dump), else stdlib json.
+Files are written compact (UTF-8, no indentation); set JSON_PRETTY=1 for indented files when debugging.
+Writes go to a temp file in the same directory and are swapped in with os.replace,
+so a crash mid-write leaves the previous file intact instead of a truncated one.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+_PRETTY = os.environ.get("JSON_PRETTY", "").lower() in ("1", "true", "yes")
+
+
+def read_json(path: Path) -> Any:
+    """Parse a JSON file. Raises OSError if unreadable, ValueError if not valid JSON."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Atomically replace path with data as JSON (no fsync: the data is cheap to lose, not to corrupt)."""
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 if _PRETTY else 0)
+    elif _PRETTY:
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    else:
+        payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    # Unique temp name: concurrent writers of the same file never share (and truncate) one temp file
+    f = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False)
+    try:
+        with f:
+            f.write(payload)
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
@@ -17,8 +17,9 @@ To obtain the JSON:
 
 import json
 import os
+import threading
 from datetime import datetime, timezone
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import gspread
 from google.oauth2.service_account import Credentials
@@ -132,6 +133,81 @@ def _ensure_headers(worksheet) -> None:
         )
 
 
+# Authorizing, opening the spreadsheet and checking headers cost several API round trips:
+# done once per process and worksheet, not per append. Dropped again if an append fails.
+_client: Optional[gspread.Client] = None
+_worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+_worksheets_lock = threading.Lock()
+
+
+def _worksheet_key(sheet_key: Optional[str], sheet_name: Optional[str]) -> Tuple[str, str]:
+    """(sheet key, worksheet name), defaulting to the SHEET_KEY / SHEET_NAME env vars."""
+    key = sheet_key or os.environ.get("SHEET_KEY")
+    if not key:
+        raise ValueError(
+            "SHEET_KEY environment variable is not set. "
+            "Provide the Google Sheet ID from the sheet URL."
+        )
+    return key, sheet_name or os.environ.get("SHEET_NAME", "Low")
+
+
+def _open_worksheet(sheet_key: Optional[str] = None, sheet_name: Optional[str] = None):
+    """Open the inventory worksheet (SHEET_KEY / SHEET_NAME env vars by default) with headers ensured."""
+    global _client
+    cache_key = _worksheet_key(sheet_key, sheet_name)
+    worksheet = _worksheets.get(cache_key)
+    if worksheet is not None:
+        return worksheet
+    with _worksheets_lock:
+        worksheet = _worksheets.get(cache_key)
+        if worksheet is None:
+            if _client is None:
+                _client = gspread.authorize(_get_credentials())
+            worksheet = _client.open_by_key(cache_key[0]).worksheet(cache_key[1])
+            _ensure_headers(worksheet)
+            _worksheets[cache_key] = worksheet
+    return worksheet
+
+
+def _forget_worksheet(sheet_key: Optional[str] = None, sheet_name: Optional[str] = None) -> None:
+    """Drop a cached worksheet (e.g. after a failed append) so the next call reopens it."""
+    with _worksheets_lock:
+        _worksheets.pop(_worksheet_key(sheet_key, sheet_name), None)
+
+
+def build_inventory_row(
+    item_name: str,
+    sender_phone: str,
+    quantity: int = 1,
+    status: str = "Low Stock",
+    supplier_name: Optional[str] = None,
+    item_type: str = "Raw",
+) -> list:
+    """
+    Build one sheet row, timestamped now.
+
+    Row format: [Timestamp, Item Name, Quantity, Status, Sender Phone, Supplier, Type]
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    return [timestamp, item_name, quantity, status, sender_phone, supplier_name or "", item_type]
+
+
+def append_prepared_rows(
+    rows: List[list],
+    sheet_key: Optional[str] = None,
+    sheet_name: Optional[str] = None,
+) -> None:
+    """Append rows built by build_inventory_row in one API call (rows may come from different senders)."""
+    if not rows:
+        return
+    worksheet = _open_worksheet(sheet_key, sheet_name)
+    try:
+        worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+    except Exception:
+        _forget_worksheet(sheet_key, sheet_name)
+        raise
+
+
 def append_inventory_row(
     item_name: str,
     sender_phone: str,
@@ -157,26 +233,13 @@ def append_inventory_row(
         sheet_key: Google Sheet ID. Uses SHEET_KEY env var if not provided.
         sheet_name: Worksheet name (e.g. "Low"). Uses SHEET_NAME env var if not provided.
     """
-    key = sheet_key or os.environ.get("SHEET_KEY")
-    if not key:
-        raise ValueError(
-            "SHEET_KEY environment variable is not set. "
-            "Provide the Google Sheet ID from the sheet URL."
-        )
-
-    ws_name = sheet_name or os.environ.get("SHEET_NAME", "Low")
-
-    creds = _get_credentials()
-    client = gspread.authorize(creds)
-    spreadsheet = client.open_by_key(key)
-    worksheet = spreadsheet.worksheet(ws_name)
-
-    _ensure_headers(worksheet)
-
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-    supplier = supplier_name or ""
-    row = [timestamp, item_name, quantity, status, sender_phone, supplier, item_type]
-    worksheet.append_row(row, value_input_option="USER_ENTERED")
+    worksheet = _open_worksheet(sheet_key, sheet_name)
+    row = build_inventory_row(item_name, sender_phone, quantity, status, supplier_name, item_type)
+    try:
+        worksheet.append_row(row, value_input_option="USER_ENTERED")
+    except Exception:
+        _forget_worksheet(sheet_key, sheet_name)
+        raise
 
 
 def append_inventory_rows(
@@ -192,21 +255,8 @@ def append_inventory_rows(
     """
     if not rows:
         return
-    key = sheet_key or os.environ.get("SHEET_KEY")
-    if not key:
-        raise ValueError(
-            "SHEET_KEY environment variable is not set. "
-            "Provide the Google Sheet ID from the sheet URL."
-        )
-    ws_name = sheet_name or os.environ.get("SHEET_NAME", "Low")
-    creds = _get_credentials()
-    client = gspread.authorize(creds)
-    spreadsheet = client.open_by_key(key)
-    worksheet = spreadsheet.worksheet(ws_name)
-    _ensure_headers(worksheet)
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
     data = [
-        [timestamp, item_name, quantity, status, sender_phone, supplier or "", item_type]
+        build_inventory_row(item_name, sender_phone, quantity, status, supplier, item_type)
         for item_name, quantity, supplier, item_type in rows
     ]
-    worksheet.append_rows(data, value_input_option="USER_ENTERED")
+    append_prepared_rows(data, sheet_key, sheet_name)
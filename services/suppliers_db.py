@@ -4,12 +4,13 @@ Suppliers database - JSON file storing supplier info.
 Fields: company_name, contact_name, contact_number.
 """
 
-import json
 import os
 import uuid
 from pathlib import Path
 from typing import List, Optional
 
+from services.json_store import read_json, write_json
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 SUPPLIERS_FILE = Path(os.environ.get("SUPPLIERS_DB_PATH", DATA_DIR / "suppliers.json"))
 
@@ -23,17 +24,15 @@ def _load() -> List[dict]:
     if not SUPPLIERS_FILE.exists():
         return []
     try:
-        with open(SUPPLIERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(SUPPLIERS_FILE)
         return data.get("suppliers", [])
-    except (json.JSONDecodeError, IOError):
+    except (ValueError, OSError):
         return []
 
 
 def _save(suppliers: List[dict]) -> None:
     _ensure_dir()
-    with open(SUPPLIERS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"suppliers": suppliers}, f, indent=2)
+    write_json(SUPPLIERS_FILE, {"suppliers": suppliers})
 
 
 def get_all() -> List[dict]:
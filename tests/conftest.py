@@ -2,31 +2,64 @@
 Pytest fixtures for Shop Assistant e2e tests.
 
 Mocks Google Sheets; uses temp items DB per test.
+Every test starts from empty DBs, so the suite can run in parallel: pytest -n auto (pytest-xdist);
+each xdist worker gets its own temp files.
 """
 
 import os
 import tempfile
 from pathlib import Path
+from typing import List
 from unittest.mock import MagicMock, patch
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
-# Set temp DBs before importing main
-TEST_ITEMS_FILE = Path(tempfile.gettempdir()) / "gbot_test_items.json"
-TEST_SUPPLIERS_FILE = Path(tempfile.gettempdir()) / "gbot_test_suppliers.json"
+# Set temp DBs before importing main (per xdist worker: gw0, gw1, ...)
+_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "")
+TEST_ITEMS_FILE = Path(tempfile.gettempdir()) / f"gbot_test_items{_WORKER}.json"
+TEST_SUPPLIERS_FILE = Path(tempfile.gettempdir()) / f"gbot_test_suppliers{_WORKER}.json"
+TEST_PREP_CONFIG_FILE = Path(tempfile.gettempdir()) / f"gbot_test_prep_config{_WORKER}.json"
+os.environ["ITEMS_DB_PATH"] = str(TEST_ITEMS_FILE)
+os.environ["SUPPLIERS_DB_PATH"] = str(TEST_SUPPLIERS_FILE)
+os.environ["PREP_CONFIG_PATH"] = str(TEST_PREP_CONFIG_FILE)
+
+# Base URL for live server tests (GET with timeout to debug page loading)
+TEST_PAGE_URL = os.environ.get("TEST_PAGE_URL", "http://localhost:8001/test")
+LIVE_BASE = TEST_PAGE_URL.rsplit("/test", 1)[0] or "http://localhost:8001"
+PAGE_LOAD_TIMEOUT = float(os.environ.get("PAGE_LOAD_TIMEOUT", "5.0"))
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip all live_server tests up front if nothing is listening (one connect instead of one per test)."""
+    live = [item for item in items if "live_server" in item.keywords]
+    if not live:
+        return
+    try:
+        httpx.get(f"{LIVE_BASE}/health", timeout=PAGE_LOAD_TIMEOUT)
+    except httpx.ConnectError as e:
+        skip = pytest.mark.skip(reason=f"Server unreachable at {LIVE_BASE}: {e}")
+        for item in live:
+            item.add_marker(skip)
+    except httpx.HTTPError:
+        pass  # reachable but slow or broken: let the tests report it
 
 
 @pytest.fixture(autouse=True)
 def temp_items_db():
-    """Use a temp items.json for each test; clear before/after."""
+    """Use a temp items.json (and prep config) for each test; clear before/after."""
     os.environ["ITEMS_DB_PATH"] = str(TEST_ITEMS_FILE)
-    if TEST_ITEMS_FILE.exists():
-        TEST_ITEMS_FILE.unlink()
+    os.environ["PREP_CONFIG_PATH"] = str(TEST_PREP_CONFIG_FILE)
+    for f in (TEST_ITEMS_FILE, TEST_PREP_CONFIG_FILE):
+        if f.exists():
+            f.unlink()
     yield
-    if TEST_ITEMS_FILE.exists():
-        TEST_ITEMS_FILE.unlink()
+    for f in (TEST_ITEMS_FILE, TEST_PREP_CONFIG_FILE):
+        if f.exists():
+            f.unlink()
     os.environ.pop("ITEMS_DB_PATH", None)
+    os.environ.pop("PREP_CONFIG_PATH", None)
 
 
 @pytest.fixture(autouse=True)
@@ -41,14 +74,32 @@ def temp_suppliers_db():
     os.environ.pop("SUPPLIERS_DB_PATH", None)
 
 
-@pytest.fixture
-def mock_sheets():
-    """Mock append_inventory_row and append_inventory_rows so we don't need Google credentials."""
+@pytest.fixture(scope="session")
+def _app():
+    """The FastAPI app (main binds the temp DB paths set above when first imported)."""
+    from main import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def _sheets_patch(_app):
+    """Patch the sheet appends once per session; mock_sheets resets the mock per test.
+    Anything that gets past the mock to the real worksheet fails loudly instead of trying the network."""
     mock_combined = MagicMock()
-    with patch("main.append_inventory_row", mock_combined), patch("main.append_inventory_rows", mock_combined):
+    no_network = MagicMock(side_effect=RuntimeError("Google Sheets is not reachable from tests"))
+    with patch("main.append_inventory_row", mock_combined), patch("main.append_inventory_rows", mock_combined), patch(
+        "services.sheets._open_worksheet", no_network
+    ):
         yield mock_combined
 
 
+@pytest.fixture
+def mock_sheets(_sheets_patch):
+    """Mock append_inventory_row and append_inventory_rows so we don't need Google credentials."""
+    _sheets_patch.reset_mock()
+    return _sheets_patch
+
+
 @pytest.fixture
 def mock_suppliers_empty():
     """Mock suppliers to return empty list (skip supplier selection in most tests)."""
@@ -58,72 +109,51 @@ def mock_suppliers_empty():
         yield
 
 
-@pytest.fixture
-def client(mock_sheets, mock_suppliers_empty):
-    """FastAPI test client with mocked sheets and empty suppliers."""
+@pytest.fixture(scope="session")
+def _test_client(_app):
+    """One TestClient for the session, kept open so every request reuses one event loop thread
+    (a TestClient used without `with` starts a new one per request). Per-test state is reset by the client fixtures."""
+    import main
+    with TestClient(_app) as c:
+        # Lifespan started the batched Sheets writer; send appends through BackgroundTasks instead,
+        # so they run before the response returns and hit the mocked append functions.
+        main._sheets_queue = None
+        yield c
+
+
+def _reset_state() -> None:
+    """Clear pending flows, the items cache and language prefs between tests."""
     from services.i18n import reset_user_langs, set_user_lang
-    from main import (
-        app,
-        _multi_mode_sessions,
-        _pending_new_item,
-        _pending_supplier_selection,
-        _pending_type_selection,
-        _pending_lang_selection,
-        _pending_preferences,
-        _pending_edit,
-        _pending_add_supplier,
-        _pending_supplier_details,
-        _pending_lows_fill,
-        _pending_need_fill,
-    )
-    _multi_mode_sessions.clear()
-    _pending_new_item.clear()
-    _pending_supplier_selection.clear()
-    _pending_type_selection.clear()
-    _pending_lang_selection.clear()
-    _pending_preferences.clear()
-    _pending_edit.clear()
-    _pending_add_supplier.clear()
-    _pending_supplier_details.clear()
-    _pending_lows_fill.clear()
-    _pending_need_fill.clear()
+    from main import _pending
+    from services.items_db import _invalidate_cache
+    _pending.clear()
+    _invalidate_cache()
     reset_user_langs()
     set_user_lang("whatsapp:+15551234567", "en")  # Tests assert on English
-    return TestClient(app)
 
 
 @pytest.fixture
-def client_suppliers(mock_sheets):
+def client(_test_client, mock_sheets, mock_suppliers_empty):
+    """FastAPI test client with mocked sheets and empty suppliers."""
+    _reset_state()
+    return _test_client
+
+
+@pytest.fixture
+def client_suppliers(_test_client, mock_sheets):
     """Client with real (temp) suppliers DB - for supplier management tests."""
-    from services.i18n import reset_user_langs, set_user_lang
-    from main import (
-        app,
-        _multi_mode_sessions,
-        _pending_new_item,
-        _pending_supplier_selection,
-        _pending_type_selection,
-        _pending_lang_selection,
-        _pending_preferences,
-        _pending_edit,
-        _pending_add_supplier,
-        _pending_supplier_details,
-        _pending_lows_fill,
-        _pending_need_fill,
-    )
-    _multi_mode_sessions.clear()
-    _pending_new_item.clear()
-    _pending_supplier_selection.clear()
-    _pending_type_selection.clear()
-    _pending_lang_selection.clear()
-    _pending_preferences.clear()
-    _pending_edit.clear()
-    _pending_add_supplier.clear()
-    _pending_supplier_details.clear()
-    _pending_lows_fill.clear()
-    _pending_need_fill.clear()
-    reset_user_langs()
-    set_user_lang("whatsapp:+15551234567", "en")  # Tests assert on English
-    return TestClient(app)
+    _reset_state()
+    return _test_client
+
+
+def seed_supplier(company_name: str, *item_names: str) -> str:
+    """Add a supplier with Raw items straight to the temp DBs (instead of the Supa + Low conversations).
+    Returns the supplier id."""
+    from services.items_db import add_items
+    from services.suppliers_db import add_supplier
+    sid = add_supplier(company_name, "John", "+1234567890")
+    add_items([(name, sid, "Raw", 1) for name in item_names])
+    return sid
 
 
 def post_whatsapp(client: TestClient, body: str, from_phone: str = "whatsapp:+15551234567") -> str:
@@ -140,3 +170,13 @@ def post_whatsapp(client: TestClient, body: str, from_phone: str = "whatsapp:+15
     msgs = re.findall(r"<Message>([^<]*)</Message>", resp.text, re.DOTALL)
     assert msgs, f"Expected TwiML Message in: {resp.text[:200]}"
     return msgs[0].strip() if len(msgs) == 1 else "\n\n".join(m.strip() for m in msgs)
+
+
+def assert_contains_any(msg: str, *needles: str) -> None:
+    """Assert msg contains at least one of needles (e.g. the English and Hebrew reply), naming them on failure."""
+    assert any(n in msg for n in needles), f"None of {needles} in: {msg[:200]}"
+
+
+def post_whatsapp_many(client: TestClient, bodies: List[str], from_phone: str = "whatsapp:+15551234567") -> List[str]:
+    """Send several messages in order (setup conversations); return each reply's text."""
+    return [post_whatsapp(client, body, from_phone) for body in bodies]